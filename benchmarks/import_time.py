@@ -0,0 +1,43 @@
+"""
+Cold start benchmark: wall time of fresh interpreters importing the library and preparing a one-shot send_packet
+invocation (everything but the network round trips).
+
+    python benchmarks/import_time.py [repetitions]
+"""
+import os
+import sys
+import time
+import subprocess
+
+
+STATEMENTS = [
+    ('baseline (empty interpreter)', 'pass'),
+    ('import fireflyapi', 'import fireflyapi'),
+    ('from fireflyapi import API', 'from fireflyapi import API'),
+    ('API() instance', 'from fireflyapi import API; API(token="x")'),
+    ('send_packet preparation', 'from fireflyapi import API, PAYLOAD_ENCODING; a = API(token="x"); a.session; '
+                                'from fireflyapi.device import Device; Device(a, eui="abcdefabcdefabcd")'),
+]
+
+
+def measure(stmt, repetitions):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+    timings = []
+    for _ in range(repetitions):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', stmt], env=env)
+        timings.append(time.time() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    base = None
+    for name, stmt in STATEMENTS:
+        t = measure(stmt, repetitions)
+        if(base is None):
+            base = t
+        print('%-32s %8.1f ms  (+%.1f ms)' % (name, t * 1000, (t - base) * 1000))
@@ -0,0 +1,52 @@
+import time
+import json
+import asyncio
+from fireflyapi.sink import SinkServer
+
+CONNECTIONS = 20
+REQUESTS = 500      # per connection
+PER_REQUEST = 10    # packets per request
+
+
+def _packet(i):
+    return {
+        'device_eui': '%016x' % (i % 1000), 'fcnt': i, 'port': 1, 'payload': 'deadbeef',
+        'received_at': '2017-03-01T10:00:00', 'gwrx': [{'gweui': '0000000000000001', 'lsnr': 7.5, 'rssi': -80}]
+    }
+
+
+async def _client(port, body):
+    # one keep-alive connection pushing REQUESTS requests
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = ('POST /?token=secret HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+               'Content-Length: %d\r\n\r\n' % len(body)).encode('latin-1') + body
+    for _ in range(REQUESTS):
+        writer.write(request)
+        await reader.readuntil(b'\r\n\r\n')
+    writer.close()
+
+
+async def _consumer(server, total):
+    received = 0
+    while(received < total):
+        batch = await server.get_batch(max_size=1000, max_wait=0.05)
+        received += len(batch)
+
+
+async def main():
+    server = SinkServer(host='127.0.0.1', port=0, secret='secret', queue_size=5000)
+    await server.start()
+
+    body = json.dumps({'packets': [_packet(i) for i in range(PER_REQUEST)]}).encode('utf-8')
+    total = CONNECTIONS * REQUESTS * PER_REQUEST
+
+    started = time.time()
+    await asyncio.gather(_consumer(server, total), *[_client(server.port, body) for _ in range(CONNECTIONS)])
+    elapsed = time.time() - started
+
+    await server.stop()
+    print('%d packets in %.2fs: %.0f packets/s, stats %s' % (total, elapsed, total / elapsed, server.stats))
+
+
+if __name__ == "__main__":
+    asyncio.new_event_loop().run_until_complete(main())
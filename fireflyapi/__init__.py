@@ -10,5 +10,30 @@ if(PY3):
 else:
     string_types = basestring
 
-from .util import HTTP_VERBS, PAYLOAD_ENCODING
-from .api import API
\ No newline at end of file
+from .util import HTTP_VERBS, PAYLOAD_ENCODING, PRIORITY
+
+# public names resolved on first access, keeps "import fireflyapi" cheap (requests & co. are imported on demand)
+_LAZY = {
+    'API': 'api',
+}
+
+_SUBMODULES = {
+    'adr', 'aio', 'api', 'api_entity', 'api_exception', 'application', 'cassette', 'change_feed', 'cli', 'delivery',
+    'device', 'device_class', 'fcnt_monitor', 'fleet_query', 'json_dump', 'link_stats', 'observable', 'packet',
+    'packet_log', 'payload', 'pipeline', 'prefetch', 'reconcile', 'records', 'scheduler', 'sink', 'util',
+    'validation', 'workers'
+}
+
+
+def __getattr__(name):
+    import importlib
+    if(name in _LAZY):
+        return getattr(importlib.import_module('.%s' % _LAZY[name], __name__), name)
+    if(name in _SUBMODULES):
+        return importlib.import_module('.%s' % name, __name__)
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
+
+if(sys.version_info < (3, 7)):
+    # no module level __getattr__ (PEP 562), import eagerly
+    from .api import API
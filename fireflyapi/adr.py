@@ -0,0 +1,194 @@
+"""
+Vectorized per device link budget analysis and ADR (adaptive data rate) recommendations, numpy is required.
+
+    cols = packet_columns(p for d in api.get_devices() for p in d.get_up_packets(limit_to_last=100)[1])
+    for rec in recommend(cols)[:50]:
+        ...
+"""
+import re
+from collections import namedtuple
+from .records import UpRecord, up_record_from_packet
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""
+Demodulation floor (required SNR in dB) per spreading factor
+"""
+REQUIRED_SNR = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+
+"""
+Recommendation for a single device. tx_power_delta_db is negative if power can be reduced, snr values are in dB,
+airtimes are per packet in milliseconds, airtime_saved_ms is the saving over the analysed packets.
+"""
+ADRRecommendation = namedtuple('ADRRecommendation', [
+    'eui', 'packets', 'spreading_factor', 'snr_max', 'margin_db', 'recommended_sf', 'tx_power_delta_db',
+    'airtime_ms', 'recommended_airtime_ms', 'airtime_saved_ms'
+])
+
+_DATR_SF = re.compile(r'SF(\d+)')
+
+# phy payload overhead (mhdr, fhdr, fport, mic) on top of the application payload
+_PHY_OVERHEAD = 13
+
+
+def _require_numpy():
+    if(np is None):
+        raise ImportError('numpy is required for ADR analysis')
+
+
+def _sf(rec_sf, datr):
+    if(rec_sf):
+        return int(rec_sf)
+    m = _DATR_SF.search(datr or '')
+    return int(m.group(1)) if m else 0
+
+
+def _payload_size(payload, size):
+    if(size):
+        return int(size)
+    # firefly delivers payloads hex encoded
+    return len(payload) // 2 if payload else 0
+
+
+def packet_columns(packets):
+    """
+    Build analysis columns from packets
+    :param packets: iterable of UpPackets or UpRecords (None is ignored), in time order
+    :return: dict of numpy arrays: eui (str), spreading_factor, lsnr, rssi, size
+    """
+    _require_numpy()
+
+    euis, sfs, snrs, rssis, sizes = [], [], [], [], []
+    for p in packets:
+        if(p is None):
+            continue
+        datr = getattr(p, 'datr', None)
+        size = getattr(p, 'size', None)
+        if(not isinstance(p, UpRecord)):
+            p = up_record_from_packet(p)
+        euis.append(p.eui)
+        sfs.append(_sf(p.spreading_factor, datr))
+        snrs.append(np.nan if p.lsnr is None else p.lsnr)
+        rssis.append(np.nan if p.rssi is None else p.rssi)
+        sizes.append(_payload_size(p.payload, size))
+
+    return {
+        'eui': np.array(euis, dtype=object),
+        'spreading_factor': np.array(sfs, dtype=np.int8),
+        'lsnr': np.array(snrs, dtype=np.float32),
+        'rssi': np.array(rssis, dtype=np.float32),
+        'size': np.array(sizes, dtype=np.int16)
+    }
+
+
+def airtime(sf, size, bandwidth=125000.0, coding_rate=1, preamble=8):
+    """
+    LoRa time on air (explicit header, crc on), vectorized
+    :param sf          : spreading factor(s)
+    :param size        : application payload size(s) in bytes
+    :param bandwidth   : bandwidth in Hz
+    :param coding_rate : 1..4 for 4/5..4/8
+    :param preamble    : preamble symbols
+    :return: time on air in milliseconds
+    """
+    _require_numpy()
+
+    sf = np.asarray(sf, dtype=np.float64)
+    pl = np.asarray(size, dtype=np.float64) + _PHY_OVERHEAD
+    t_sym = np.power(2.0, sf) / bandwidth * 1000.0
+    de = ((t_sym > 16.0)).astype(np.float64)  # low data rate optimization
+    n_payload = 8 + np.maximum(np.ceil((8 * pl - 4 * sf + 28 + 16) / (4 * (sf - 2 * de))) * (coding_rate + 4), 0)
+    return (preamble + 4.25) * t_sym + n_payload * t_sym
+
+
+def recommend(columns, installation_margin=10.0, min_packets=20, step_db=3.0, max_power_steps=7, power_step_db=2.0,
+              min_sf=7, max_sf=12):
+    """
+    Per device link margin and ADR recommendation (LoRaWAN network server style: max snr over the history against the
+    demodulation floor of the current spreading factor, every step_db of margin allows one data rate step, left over
+    steps lower the tx power). Devices below the floor are moved to higher spreading factors.
+
+    :param columns             : dict of arrays as returned by packet_columns (or a structured array with those
+                                 fields, i.e. PacketLogReader.as_numpy()), rows in time order
+    :param installation_margin : safety margin in dB
+    :param min_packets         : devices with less packets are skipped
+    :param step_db             : margin per data rate / power step
+    :param max_power_steps     : maximum number of tx power reduction steps
+    :param power_step_db       : tx power step in dB
+    :param min_sf              : fastest spreading factor to recommend
+    :param max_sf              : slowest spreading factor to recommend
+    :return: list of ADRRecommendations ranked by total airtime saved
+    """
+    _require_numpy()
+
+    eui = np.asarray(columns['eui'])
+    sf = np.asarray(columns['spreading_factor']).astype(np.int64)
+    snr = np.asarray(columns['lsnr']).astype(np.float64)
+    if(_has(columns, 'size')):
+        size = np.asarray(columns['size'])
+    elif(_has(columns, 'payload_length')):
+        # packet log payloads are stored hex encoded
+        size = np.asarray(columns['payload_length']) // 2
+    else:
+        size = np.zeros(len(sf))
+
+    valid = (sf >= 7) & (sf <= 12)
+    eui, sf, snr, size = eui[valid], sf[valid], snr[valid], np.asarray(size, dtype=np.float64)[valid]
+    if(not len(sf)):
+        return []
+
+    keys, codes = np.unique(eui, return_inverse=True)
+    n = len(keys)
+
+    count = np.bincount(codes, minlength=n)
+    snr_max = np.full(n, -np.inf)
+    np.fmax.at(snr_max, codes, snr)
+    last = np.full(n, -1, dtype=np.int64)
+    np.maximum.at(last, codes, np.arange(len(codes)))
+    cur_sf = sf[last]
+    mean_size = np.bincount(codes, weights=size, minlength=n) / count
+
+    floor = np.array([REQUIRED_SNR.get(s, np.nan) for s in range(13)])[cur_sf]
+    margin = snr_max - floor - installation_margin
+    # devices without snr reports keep their settings
+    margin[~np.isfinite(margin)] = np.nan
+    steps = np.floor(margin / step_db)
+    steps[~np.isfinite(steps)] = 0
+    steps = steps.astype(np.int64)
+
+    down = np.clip(steps, 0, np.maximum(cur_sf - min_sf, 0))
+    power = np.clip(steps - down, 0, max_power_steps)
+    # negative margin: one spreading factor up per step (2.5 dB floor difference)
+    deficit = np.nan_to_num(-np.minimum(margin, 0))
+    up = np.clip(np.ceil(deficit / 2.5).astype(np.int64), 0, np.maximum(max_sf - cur_sf, 0))
+    new_sf = cur_sf - down + up
+
+    at_cur = airtime(cur_sf, mean_size)
+    at_new = airtime(new_sf, mean_size)
+    saved = (at_cur - at_new) * count
+
+    keep = count >= min_packets
+    order = np.argsort(-saved[keep], kind='stable')
+    idx = np.nonzero(keep)[0][order]
+
+    return [
+        ADRRecommendation(
+            _eui_str(keys[i]), int(count[i]), int(cur_sf[i]), float(snr_max[i]), float(margin[i]), int(new_sf[i]),
+            0.0 - power_step_db * float(power[i]), float(at_cur[i]), float(at_new[i]), float(saved[i])
+        ) for i in idx
+    ]
+
+
+def _has(columns, name):
+    if(hasattr(columns, 'dtype') and columns.dtype.names):
+        return name in columns.dtype.names
+    return name in columns
+
+
+def _eui_str(eui):
+    if(isinstance(eui, (int, np.integer))):
+        return '%016x' % int(eui)
+    return eui
@@ -0,0 +1,70 @@
+"""
+asyncio front end (Python 3.5+). Requests are executed by API.call in an executor, concurrent identical GET requests
+of coroutines on the same loop are coalesced before they reach the executor (and across threads by API.call itself).
+"""
+import asyncio
+import functools
+from . import HTTP_VERBS
+from .api import flight_key
+
+
+class AsyncAPI(object):
+    """
+    asyncio wrapper around an API instance
+
+        aapi = AsyncAPI(API(token=...))
+        dev = await aapi.get_device(eui='...')
+
+    :param api      : API instance doing the actual requests
+    :param executor : concurrent.futures executor to run requests in (defaults to the loop's default executor)
+    """
+
+    def __init__(self, api, executor=None):
+        self.api = api
+        self.executor = executor
+        self._inflight = {}
+
+    async def call(self, method, endpoint, query=None, data=None, coalesce=True, priority=None, deadline=None):
+        """
+        Coroutine version of API.call
+        """
+        loop = asyncio.get_event_loop()
+        run = functools.partial(self.api.call, method, endpoint, query, data, coalesce, priority, deadline)
+
+        if(not coalesce or method != HTTP_VERBS.GET):
+            return await loop.run_in_executor(self.executor, run)
+
+        key = (id(loop), flight_key(method, endpoint, query))
+        fut = self._inflight.get(key)
+        if(fut is not None):
+            with self.api._flight_lock:
+                self.api.coalescing['coalesced'] += 1
+            # shield: a cancelled waiter must not cancel the shared request
+            return await asyncio.shield(fut)
+
+        fut = asyncio.ensure_future(loop.run_in_executor(self.executor, run))
+        self._inflight[key] = fut
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if(self._inflight.get(key) is fut):
+                del self._inflight[key]
+
+    async def get_device(self, eui=None, address=None):
+        """
+        Coroutine version of API.get_device
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.api.get_device, eui, address))
+
+    async def get_up_packets(self, device, limit_to_last=1, offset=0, received_after=0):
+        """
+        Coroutine version of Device.get_up_packets, the packets are returned as list
+        """
+        loop = asyncio.get_event_loop()
+
+        def _fetch():
+            count, packets = device.get_up_packets(limit_to_last, offset, received_after)
+            return count, [p for p in packets if p is not None]
+
+        return await loop.run_in_executor(self.executor, _fetch)
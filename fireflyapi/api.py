@@ -1,20 +1,67 @@
 from . import logger
-from . import HTTP_VERBS, PAYLOAD_ENCODING
+from . import HTTP_VERBS, PAYLOAD_ENCODING, PRIORITY
 import sys
+import time
 import logging
-try:
-    import ujson as json
-except ImportError:
-    import json
-import requests
+import threading
+import weakref
+from contextlib import contextmanager
 from .api_exception import APIException, EntityNotFoundError, EntityAlreadyCreatedError
-from .device import Device
-from .device_class import DeviceClass
-from .application import Application
+from .util import RateLimiter
+from .scheduler import RequestScheduler
+# requests and the entity modules are imported on first use, keeps cold starts of short lived jobs fast
 
 
 DEFAULT_HEADERS = {'Accept': 'application/json'}
 
+_logger_lock = threading.Lock()
+
+
+def flight_key(method, endpoint, query):
+    """
+    Identity of a request for coalescing: method, endpoint and query without the auth token
+    """
+    return method, endpoint, tuple(sorted((str(k), str(v)) for k, v in (query or {}).items() if k != 'auth'))
+
+
+class _SharedResponse(object):
+    """
+    Response handed to coalesced callers, the body is json decoded once for all of them (don't mutate the result)
+    """
+    def __init__(self, response, flight):
+        self._response = response
+        self._flight = flight
+
+    def json(self):
+        return self._flight.decoded()
+
+    def __getattr__(self, item):
+        return getattr(self._response, item)
+
+
+class _Flight(object):
+    """
+    In-flight request shared by coalesced callers
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._decoded = None
+
+    def decoded(self):
+        with self._lock:
+            if(self._decoded is None):
+                self._decoded = self.response.json()
+            return self._decoded
+
+    def wait(self):
+        self.done.wait()
+        if(self.error is not None):
+            raise self.error
+        return _SharedResponse(self.response, self)
+
 
 class API(object):
     """
@@ -28,8 +75,32 @@ class API(object):
     :param base    : base uri (defaults to /api)
     :param loglevel: logging verbosity
     :param orga_id : organization id, not retrievable over REST-API
+    :param prewarm : open a connection to the server in background right away
+    :param pool_size: maximum number of pooled (keep-alive) connections
+    :param transport: object with a send(api, method, endpoint, url, query, data) method replacing the HTTP transport
+                      (see cassette.RecordingTransport/ReplayTransport)
+    :param rate_limit: maximum requests per second (token bucket, see rate_limiter), None for no limit
+    :param max_concurrency: maximum number of requests in flight, None for no limit
+    :param priority_weights: dict PRIORITY -> weight overriding scheduler.DEFAULT_WEIGHTS
+
+    Concurrent identical GET requests share one HTTP request (see call()), the counters in coalescing show how many
+    requests were actually sent and how many callers were served by an in-flight request.
+
+    If a rate limit or maximum concurrency is set, requests are dispatched by a RequestScheduler: interactive, normal
+    and bulk requests (see call() and priority()) share the budget by weight, so single device lookups and downlinks
+    are not queued behind page requests of background jobs. get_device and send_packet default to interactive,
+    packet page generators to bulk.
+
+    Entities are kept in an identity map: fetching the same device (by eui), application or device class again updates
+    and returns the already known instance.
+
+    A single API instance, the Devices it returns and their packet generators' requests may be shared between threads:
+    requests go through one pooled session (size the pool to the number of threads), lazily built shared state is
+    guarded by locks and Devices lock their own state on mutation (see Observable.lock()).
     """
     token = None
+    _session = None
+    _logger_ready = False
 
     version = 1
     base = 'api'
@@ -37,9 +108,14 @@ class API(object):
     port = 443
     orga_id = 0
 
-    def __init__(self, token=None, server=None, port=None, version=None, base=None, loglevel=logging.DEBUG, orga_id=0):
+    def __init__(self, token=None, server=None, port=None, version=None, base=None, loglevel=logging.DEBUG, orga_id=0,
+                 prewarm=False, pool_size=10, transport=None, rate_limit=None, max_concurrency=None,
+                 priority_weights=None):
         self.loglevel = loglevel
-        logger.setLevel(loglevel)
+        with _logger_lock:
+            # the logger is shared by all instances, only ever raise its verbosity
+            if(logger.level == logging.NOTSET or loglevel < logger.level):
+                logger.setLevel(loglevel)
 
         if(not token or len(token) == 0):
             raise APIException('invalid token')
@@ -58,7 +134,114 @@ class API(object):
 
         self.token = token
         self.orga_id = orga_id
-        self.init_logger()
+        self.pool_size = pool_size
+        self.transport = transport
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.priority_weights = priority_weights
+        self.scheduler = None
+        if(rate_limit or max_concurrency):
+            self.scheduler = RequestScheduler(max_concurrency, self.rate_limiter, priority_weights)
+        self._context = threading.local()
+        self._lock = threading.Lock()
+
+        # identity map: one shared in-memory object per entity (devices are held weakly)
+        self._identity_lock = threading.RLock()
+        self._devices = weakref.WeakValueDictionary()
+        self._applications = {}
+        self._device_classes = {}
+        self._listed = set()
+
+        # single flight request coalescing
+        self._flight_lock = threading.Lock()
+        self._inflight = {}
+        self.coalescing = {'requests': 0, 'coalesced': 0}
+
+        if(prewarm):
+            self.prewarm()
+
+    def _setup_logger(self):
+        # handlers are set up on first request only
+        if(not self._logger_ready):
+            with self._lock:
+                if(not self._logger_ready):
+                    self.init_logger()
+                    self._logger_ready = True
+
+    @property
+    def session(self):
+        """
+        requests session (connection pool) of this API instance, created on first use
+        """
+        if(self._session is None):
+            with self._lock:
+                if(self._session is None):
+                    import requests
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def prewarm(self, wait=False):
+        """
+        Import the http stack and open a (keep-alive) connection to the server, so the first real request does not pay
+        for dns lookup and tls handshake. Errors are ignored.
+        :param wait: block until done, otherwise prewarm in a background thread
+        """
+        def _warm():
+            try:
+                self.session.head('https://%s:%s/' % (self.server, self.port), timeout=10)
+            except Exception as e:
+                logger.debug('prewarming failed: %s' % e)
+
+        if(wait):
+            _warm()
+        else:
+            t = threading.Thread(target=_warm)
+            t.daemon = True
+            t.start()
+
+    def set_rate_limit(self, rate):
+        """
+        Change the request rate limit, the RequestScheduler is set up on demand
+        :param rate: requests per second, None for no limit
+        """
+        with self._lock:
+            if(not rate):
+                self.rate_limiter = None
+            elif(self.rate_limiter is None):
+                self.rate_limiter = RateLimiter(rate)
+            else:
+                self.rate_limiter.set_rate(rate)
+
+            if(self.scheduler is not None):
+                self.scheduler.rate_limiter = self.rate_limiter
+            elif(self.rate_limiter is not None):
+                self.scheduler = RequestScheduler(None, self.rate_limiter, self.priority_weights)
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Default priority of all requests made by the current thread within the block
+
+            with api.priority(PRIORITY.BULK):
+                backfill(api)
+
+        :param priority: PRIORITY class
+        """
+        previous = getattr(self._context, 'priority', None)
+        self._context.priority = priority
+        try:
+            yield
+        finally:
+            self._context.priority = previous
+
+    def current_priority(self, default=PRIORITY.NORMAL):
+        """
+        :return: the priority set by priority() for the current thread, default otherwise
+        """
+        priority = getattr(self._context, 'priority', None)
+        return default if priority is None else priority
 
     def init_logger(self):
         """
@@ -70,15 +253,75 @@ class API(object):
         ch.setFormatter(formatter)
         logger.addHandler(ch)
 
-    def call(self, method, endpoint, query=None, data=None):
+    def call(self, method, endpoint, query=None, data=None, coalesce=True, priority=None, deadline=None):
         """
-        Basic call to REST API
+        Basic call to REST API. Concurrent identical GET requests (same endpoint and query) are coalesced into a single
+        HTTP request, every caller receives its result (or exception).
         :param method  : HTTP Method to use (HTTP enum)
         :param endpoint: Endpoint to request
         :param query   : URL params as dict
         :param data    : data to be sent using POST/PUT/PATCH/...
+        :param coalesce: share in-flight GET requests
+        :param priority: PRIORITY class, defaults to the thread's priority() or NORMAL (coalesced callers are served at
+                         the priority of the first caller)
+        :param deadline: seconds the request may wait for dispatch by the scheduler, DeadlineExceededError is raised
+                         otherwise
         :return: the response object returned by the request
         """
+        if(priority is None):
+            priority = self.current_priority()
+        if(deadline is not None):
+            deadline = time.time() + deadline
+
+        if(not coalesce or method != HTTP_VERBS.GET):
+            return self._request(method, endpoint, query, data, priority, deadline)
+
+        key = flight_key(method, endpoint, query)
+        with self._flight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if(leader):
+                flight = self._inflight[key] = _Flight()
+                self.coalescing['requests'] += 1
+            else:
+                self.coalescing['coalesced'] += 1
+
+        if(not leader):
+            return flight.wait()
+
+        try:
+            flight.response = self._request(method, endpoint, query, data, priority, deadline)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flight_lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def http_send(self, method, endpoint, url, query, data):
+        """
+        Default transport: send a request using the session
+        :return: requests response
+        """
+        session = self.session
+        if(method == HTTP_VERBS.GET):
+            response = session.get(url=url, params=query, headers=DEFAULT_HEADERS)
+        elif(method == HTTP_VERBS.POST):
+            response = session.post(url=url, params=query, json=data, headers=DEFAULT_HEADERS)
+        elif (method == HTTP_VERBS.PUT):
+            response = session.put(url=url, params=query, json=data, headers=DEFAULT_HEADERS)
+        elif (method == HTTP_VERBS.DELETE):
+            response = session.delete(url=url, params=query, headers=DEFAULT_HEADERS)
+        else:
+            raise APIException('unsupported HTTP verb %s' % method)
+
+        return response
+
+    def _request(self, method, endpoint, query=None, data=None, priority=PRIORITY.NORMAL, deadline=None):
+        self._setup_logger()
+
         if(not query):
             query = {}
 
@@ -93,14 +336,16 @@ class API(object):
         logger.debug('requesting [%s] : %s%s' % (HTTP_VERBS.reverse_mapping[method], url,
             '' if not query else '?%s' % '&'.join(['%s=%s' % (k, v) for k, v in query.items() if not k == 'auth'])))
 
-        if(method == HTTP_VERBS.GET):
-            response = requests.get(url=url, params=query, headers=DEFAULT_HEADERS)
-        elif(method == HTTP_VERBS.POST):
-            response = requests.post(url=url, params=query, json=data, headers=DEFAULT_HEADERS)
-        elif (method == HTTP_VERBS.PUT):
-            response = requests.put(url=url, params=query, json=data, headers=DEFAULT_HEADERS)
-        elif (method == HTTP_VERBS.DELETE):
-            response = requests.delete(url=url, params=query, headers=DEFAULT_HEADERS)
+        if(self.scheduler is not None):
+            self.scheduler.acquire(priority, deadline)
+        try:
+            if(self.transport is not None):
+                response = self.transport.send(self, method, endpoint, url, query, data)
+            else:
+                response = self.http_send(method, endpoint, url, query, data)
+        finally:
+            if(self.scheduler is not None):
+                self.scheduler.release()
 
         logger.debug('successfully requested  %s' % url)
         if(data and not method in [HTTP_VERBS.GET,HTTP_VERBS.DELETE]):
@@ -146,12 +391,40 @@ class API(object):
 
         return response
 
+    def _resolve(self, table, key, cls, data):
+        """
+        Get the shared instance for key, updated in place with data, or create and register a new one
+        """
+        with self._identity_lock:
+            ent = table.get(key)
+            if(ent is None):
+                ent = cls(self, **data)
+                table[key] = ent
+            else:
+                ent._update(data)
+            return ent
+
+    def _register_device(self, device, remove=False):
+        with self._identity_lock:
+            key = str(device.eui).lower()
+            if(remove):
+                if(self._devices.get(key) is device):
+                    del self._devices[key]
+            else:
+                self._devices[key] = device
+
+    def _resolve_device(self, data):
+        from .device import Device
+        data['_exists'] = True
+        return self._resolve(self._devices, str(data.get('eui')).lower(), Device, data)
+
     def get_devices(self, tags=None):
         """
         Get the list of devices accessible by the given API-Token
         :param tags: filter devices by given tags (list)
         :return: generator providing devices
         """
+        from .device import Device
         query = {}
 
         if(tags and not isinstance(tags, list)):
@@ -168,8 +441,7 @@ class API(object):
             yield None
 
         for dev in responsedata['devices']:
-            dev['_exists'] = True
-            yield Device(self, **dev)
+            yield self._resolve_device(dev)
 
     def get_device(self, eui=None, address=None):
         """
@@ -178,43 +450,80 @@ class API(object):
         :param address  : the device's address
         :return: The fetched Device
         """
+        from .device import Device
         if(not eui and not address):
             raise APIException('No identifier given')
 
         if(eui):
-            response = self.call(HTTP_VERBS.GET, 'devices/eui/%s' % eui)
+            response = self.call(HTTP_VERBS.GET, 'devices/eui/%s' % eui,
+                                 priority=self.current_priority(PRIORITY.INTERACTIVE))
         elif(address):
-            response = self.call(HTTP_VERBS.GET, 'devices/address/%s' % address)
+            response = self.call(HTTP_VERBS.GET, 'devices/address/%s' % address,
+                                 priority=self.current_priority(PRIORITY.INTERACTIVE))
 
         respdata = response.json()
 
         if(not 'device' in respdata):
             raise APIException('no such device %s="%s"' % ('eui' if eui else 'address', eui if eui else address))
 
-        ret =Device(self, **respdata['device'])
-        ret._exists = True
-        return ret
+        return self._resolve_device(respdata['device'])
 
     def get_device_classes(self):
         """
         Get the list of devices_classes accessible by the given API-Token
         :return: generator providing device classes
         """
+        from .device_class import DeviceClass
         response = self.call(HTTP_VERBS.GET, 'device_classes/')
 
         respdata = response.json()
 
-        for devc in respdata['device_classes']:
-            yield DeviceClass(self, **devc)
+        # resolve all before yielding, so the listing is complete even if the caller stops early
+        classes = [self._resolve(self._device_classes, devc.get('id'), DeviceClass, devc)
+                   for devc in respdata['device_classes']]
+        self._listed.add('device_classes')
+        for devc in classes:
+            yield devc
 
     def get_applications(self):
         """
         Get the list of applications accessible by the given API-Token
         :return: generator providing applicatios
         """
+        from .application import Application
         response = self.call(HTTP_VERBS.GET, 'applications/')
 
         respdata = response.json()
 
-        for app in respdata['applications']:
-            yield Application(self, **app)
+        # resolve all before yielding, so the listing is complete even if the caller stops early
+        apps = [self._resolve(self._applications, app.get('id'), Application, app) for app in respdata['applications']]
+        self._listed.add('applications')
+        for app in apps:
+            yield app
+
+    def _lookup(self, table, listing, key, fetch):
+        with self._identity_lock:
+            ent = table.get(key)
+            if(ent is not None or listing in self._listed):
+                return ent
+
+        # unknown: fetch the whole listing once, it populates the identity map
+        for _ in fetch():
+            pass
+        return table.get(key)
+
+    def get_application(self, app_id):
+        """
+        Get the shared Application instance by id. The application listing is requested once, if not done yet.
+        :param app_id: application (internal) id
+        :return: Application or None
+        """
+        return self._lookup(self._applications, 'applications', app_id, self.get_applications)
+
+    def get_device_class(self, class_id):
+        """
+        Get the shared DeviceClass instance by id. The device class listing is requested once, if not done yet.
+        :param class_id: device class id
+        :return: DeviceClass or None
+        """
+        return self._lookup(self._device_classes, 'device_classes', class_id, self.get_device_classes)
@@ -21,4 +21,21 @@ class EntityNotFoundError(APIException):
     """
 
     def __init__(self, json):
-        super(EntityNotFoundError, self).__init__('entity does not exists', json)
\ No newline at end of file
+        super(EntityNotFoundError, self).__init__('entity does not exists', json)
+
+
+class DeadlineExceededError(APIException):
+    """
+    Error raised if a request could not be dispatched before its deadline (see API.call)
+    """
+    def __init__(self, msg):
+        super(DeadlineExceededError, self).__init__(msg)
+
+
+class DeviceValidationError(APIException):
+    """
+    Error raised if a device record is invalid (see validation.validate_device), issues holds the issue messages
+    """
+    def __init__(self, issues):
+        self.issues = issues
+        super(DeviceValidationError, self).__init__('invalid device: %s' % '; '.join(issues))
@@ -25,6 +25,13 @@ class Application(APIEntity):
 
     def __init__(self, api, **args):
         self.api = api
+        self._exists = True
+        self._update(args)
+
+    def _update(self, args):
+        """
+        Update members in place from a (re-)fetched API dict
+        """
         if ('created_at' in args):
             self.created = int(
                 time.mktime(datetime.strptime(args.pop('created_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
@@ -33,7 +40,6 @@ class Application(APIEntity):
             self.updated = int(
                 time.mktime(datetime.strptime(args.pop('updated_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
 
-        self._exists = True
         self.__dict__.update(args)
 
     def export(self):
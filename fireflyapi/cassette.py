@@ -0,0 +1,228 @@
+"""
+Record/replay transports: capture real API traffic into a compact cassette file (gzipped json lines) and serve it back
+offline, i.e. to load test and benchmark pipelines built on this library without touching production.
+
+    rec = RecordingTransport('traffic.jsonl.gz')
+    api = API(token=..., transport=rec)
+    ...                                   # run the workload
+    rec.close()
+
+    api = API(token='offline', transport=ReplayTransport('traffic.jsonl.gz', speed=10))
+"""
+import gzip
+import time
+import base64
+import threading
+from collections import deque
+try:
+    import ujson as json
+except ImportError:
+    import json
+from . import HTTP_VERBS, logger
+from .api import flight_key
+from .api_exception import APIException
+
+
+class _Headers(dict):
+    """
+    Case insensitive (lower case keyed) header dict
+    """
+    def __init__(self, headers=None):
+        dict.__init__(self, ((k.lower(), v) for k, v in (headers or {}).items()))
+
+    def get(self, key, default=None):
+        return dict.get(self, key.lower(), default)
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key.lower())
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key.lower())
+
+
+class ReplayResponse(object):
+    """
+    Minimal stand-in for a requests response
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = _Headers(headers)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class RecordingTransport(object):
+    """
+    Transport recording every request/response (including timing and status) while passing it on to the real
+    transport. The auth token is never recorded.
+
+    :param path  : cassette file, gzip compressed if it ends with .gz
+    :param inner : transport to record, defaults to the API's HTTP transport
+    """
+
+    def __init__(self, path, inner=None):
+        self.path = path
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._f = gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+
+    def send(self, api, method, endpoint, url, query, data):
+        started = time.time()
+        if(self.inner is not None):
+            response = self.inner.send(api, method, endpoint, url, query, data)
+        else:
+            response = api.http_send(method, endpoint, url, query, data)
+        elapsed = time.time() - started
+
+        content = response.content or b''
+        try:
+            body, binary = content.decode('utf-8'), False
+        except UnicodeDecodeError:
+            body, binary = base64.b64encode(content).decode('ascii'), True
+
+        entry = {
+            't': started - self._start,
+            'elapsed': elapsed,
+            'method': HTTP_VERBS.reverse_mapping[method],
+            'endpoint': endpoint,
+            'query': dict((k, v) for k, v in (query or {}).items() if k != 'auth'),
+            'data': data,
+            'status': response.status_code,
+            'headers': {'content-type': response.headers.get('content-type', '')},
+            'body': body,
+            'binary': binary
+        }
+        line = json.dumps(entry)
+        with self._lock:
+            self._f.write(line)
+            self._f.write('\n')
+
+        return response
+
+    def close(self):
+        with self._lock:
+            if(self._f is not None):
+                self._f.close()
+                self._f = None
+
+
+def load_cassette(path):
+    """
+    :param path: cassette file
+    :return: list of recorded interactions (dicts) in recording order
+    """
+    f = gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+    with f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+class ReplayTransport(object):
+    """
+    Transport serving recorded responses. Requests are matched by method, endpoint and query, repeated identical
+    requests get the recorded responses in recording order.
+
+    :param cassette    : cassette path or list of interactions
+    :param speed       : None/0 answers immediately, otherwise recorded latencies are replayed divided by speed
+                         (1 = real time, 10 = ten times faster)
+    :param concurrency : maximum number of requests served at the same time (None = unlimited), further requests wait
+    :param cycle       : start over with the first recorded response once all responses of a request are used up,
+                         otherwise unmatched requests raise an APIException
+    """
+
+    def __init__(self, cassette, speed=None, concurrency=None, cycle=True):
+        if(not isinstance(cassette, list)):
+            cassette = load_cassette(cassette)
+
+        self.speed = speed
+        self.cycle = cycle
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self._lock = threading.Lock()
+        self._recorded = {}
+        for entry in cassette:
+            key = flight_key(HTTP_VERBS.mapping[entry['method']], entry['endpoint'], entry['query'])
+            self._recorded.setdefault(key, []).append(entry)
+        self._pending = dict((k, deque(v)) for k, v in self._recorded.items())
+
+    def _next(self, key):
+        with self._lock:
+            pending = self._pending.get(key)
+            if(not pending):
+                if(not self.cycle or key not in self._recorded):
+                    raise APIException('no recorded response for %s %s' % (HTTP_VERBS.reverse_mapping[key[0]], key[1]))
+                pending = self._pending[key] = deque(self._recorded[key])
+            return pending.popleft()
+
+    def send(self, api, method, endpoint, url, query, data):
+        entry = self._next(flight_key(method, endpoint, query))
+
+        if(self._slots):
+            self._slots.acquire()
+        try:
+            if(self.speed):
+                time.sleep(entry['elapsed'] / self.speed)
+        finally:
+            if(self._slots):
+                self._slots.release()
+
+        body = entry['body']
+        content = base64.b64decode(body) if entry.get('binary') else body.encode('utf-8')
+        return ReplayResponse(entry['status'], entry['headers'], content)
+
+
+def replay_requests(api, cassette, speed=None, concurrency=8):
+    """
+    Re-issue the requests of a cassette through an API instance (i.e. one using a ReplayTransport, or a staging server)
+    keeping the recorded arrival pattern. Useful as a deterministic load generator.
+    :param api         : API instance
+    :param cassette    : cassette path or list of interactions
+    :param speed       : None/0 sends as fast as possible, otherwise recorded arrival times are divided by speed
+    :param concurrency : number of concurrently issuing threads
+    :return: dict with request count, error count and wall time
+    """
+    if(not isinstance(cassette, list)):
+        cassette = load_cassette(cassette)
+
+    todo = deque(cassette)
+    lock = threading.Lock()
+    stats = {'requests': 0, 'errors': 0}
+    start = time.time()
+
+    def _worker():
+        while(True):
+            with lock:
+                if(not todo):
+                    return
+                entry = todo.popleft()
+
+            if(speed):
+                delay = entry['t'] / speed - (time.time() - start)
+                if(delay > 0):
+                    time.sleep(delay)
+
+            try:
+                api.call(HTTP_VERBS.mapping[entry['method']], entry['endpoint'], query=dict(entry['query']),
+                         data=entry['data'], coalesce=False)
+                err = 0
+            except APIException as e:
+                logger.debug('replayed request failed: %s' % e)
+                err = 1
+
+            with lock:
+                stats['requests'] += 1
+                stats['errors'] += err
+
+    workers = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    stats['seconds'] = time.time() - start
+    return stats
@@ -0,0 +1,177 @@
+"""
+Device inventory change feed: polls the device list and emits created, updated and removed events relative to the
+previous poll, so downstream systems (CMDB mirrors, caches) get deltas instead of full dumps.
+
+    feed = DeviceChangeFeed(api, state_path='inventory.state')
+    for change in feed.poll():
+        if(change.event == 'removed'):
+            cmdb.delete(change.eui)
+        else:
+            cmdb.upsert(change.device)
+    feed.commit()                       # acknowledge the changes, the next poll is relative to this one
+
+Delivery is at least once: changes not committed (i.e. the downstream write failed) are emitted again by the next
+poll. The state is one fixed size record per device (eui as 64 bit integer, last seen updated_at and a 32 bit content
+fingerprint, 20 bytes), the raw device list is compared against it without building Device objects, only changed
+devices are resolved to Devices.
+"""
+import os
+import struct
+import time
+from collections import namedtuple
+from . import HTTP_VERBS, PRIORITY, logger
+from .api_exception import APIException
+from .device import _ref_id
+from .reconcile import normalize_record, content_hash
+from .util import to_timestamp
+
+
+"""
+Change event: event is one of 'created', 'updated', 'removed'. device is the Device (None for removed devices),
+updated_at the device's updated_at in unix seconds (last known one for removed devices).
+"""
+DeviceChange = namedtuple('DeviceChange', ['event', 'eui', 'device', 'updated_at'])
+
+_MAGIC = b'FFCF\x01'
+_RECORD = struct.Struct('<QdI')
+
+
+def _fingerprint(data):
+    values = dict(data)
+    values['application'] = _ref_id(values.get('application'))
+    return int(content_hash(normalize_record(values))[:8], 16)
+
+
+def _eui_int(eui):
+    return int(str(eui), 16)
+
+
+class DeviceChangeFeed(object):
+    """
+    Incremental device inventory changes
+
+    :param api        : API reference
+    :param state_path : file the state is loaded from and saved to on every commit, None keeps it in memory only
+    :param tags       : only watch devices with the given tags
+    :param initial    : emit created events for all devices on the first poll without state, otherwise the first
+                        poll only records the state
+    """
+
+    def __init__(self, api, state_path=None, tags=None, initial=True):
+        self.api = api
+        self.state_path = state_path
+        self.tags = tags
+        self.initial = initial
+        # eui (int) -> (updated_at, fingerprint)
+        self.state = None
+        self.last_poll = None
+        # (state, poll time) of the last poll, applied by commit()
+        self._pending = None
+
+        if(state_path and os.path.exists(state_path)):
+            self.load()
+
+    def load(self):
+        """
+        Load the state from state_path
+        """
+        with open(self.state_path, 'rb') as f:
+            raw = f.read()
+        if(not raw.startswith(_MAGIC)):
+            raise APIException('%s is not a change feed state file' % self.state_path)
+
+        offset = len(_MAGIC)
+        (self.last_poll,) = struct.unpack_from('<d', raw, offset)
+        offset += 8
+        state = {}
+        for eui, updated, fp in _iter_records(raw, offset):
+            state[eui] = (updated, fp)
+        self.state = state
+
+    def save(self):
+        """
+        Atomically write the state to state_path
+        """
+        tmp = '%s.tmp' % self.state_path
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('<d', self.last_poll or 0.0))
+            f.write(b''.join(_RECORD.pack(eui, v[0], v[1]) for eui, v in sorted(self.state.items())))
+        if(os.name == 'nt' and os.path.exists(self.state_path)):
+            os.remove(self.state_path)
+        os.rename(tmp, self.state_path)
+
+    def _fetch(self):
+        query = {'tags': ','.join(self.tags)} if self.tags else {}
+        return self.api.call(HTTP_VERBS.GET, 'devices', query=query,
+                             priority=self.api.current_priority(PRIORITY.BULK)).json()['devices'] or []
+
+    def poll(self):
+        """
+        Fetch the device list and compute the changes since the last committed poll, the state is only updated by
+        commit()
+        :return: list of DeviceChanges, created and updated in device list order followed by removed ones
+        """
+        devices = self._fetch()
+        previous = self.state
+        emit = previous is not None or self.initial
+        previous = previous or {}
+
+        changes = []
+        current = {}
+        for data in devices:
+            eui = _eui_int(data['eui'])
+            updated = to_timestamp(data.get('updated_at'))
+            fp = _fingerprint(data)
+            current[eui] = (updated, fp)
+
+            known = previous.get(eui)
+            if(known is None):
+                event = 'created'
+            elif(updated > known[0] or fp != known[1]):
+                event = 'updated'
+            else:
+                continue
+            if(emit):
+                changes.append(DeviceChange(event, str(data['eui']).lower(), self.api._resolve_device(dict(data)),
+                                            updated))
+
+        if(emit):
+            for eui in set(previous) - set(current):
+                changes.append(DeviceChange('removed', '%016x' % eui, None, previous[eui][0]))
+
+        self._pending = (current, time.time())
+
+        logger.debug('device change feed: %s devices, %s changes' % (len(current), len(changes)))
+        return changes
+
+    def commit(self):
+        """
+        Acknowledge the changes of the last poll: the state is updated and saved
+        """
+        if(self._pending is None):
+            return
+        self.state, self.last_poll = self._pending
+        self._pending = None
+        if(self.state_path):
+            self.save()
+
+    def follow(self, interval=3600):
+        """
+        Poll forever, every poll is committed once all of its changes were consumed (a failing consumer gets them
+        again after a restart)
+        :param interval: seconds between polls
+        :return: generator providing DeviceChanges
+        """
+        while(True):
+            started = time.time()
+            for change in self.poll():
+                yield change
+            self.commit()
+            time.sleep(max(interval - (time.time() - started), 0))
+
+
+def _iter_records(raw, offset):
+    size = _RECORD.size
+    for i in range(offset, len(raw) - size + 1, size):
+        yield _RECORD.unpack_from(raw, i)
@@ -0,0 +1,287 @@
+"""
+Command line interface, run as
+    python -m fireflyapi dump devices|packets|down-packets [options]
+
+Output is streamed as NDJSON or CSV, memory usage only depends on page size and the number of parallel jobs.
+"""
+import os
+import sys
+import csv
+import shutil
+import logging
+import tempfile
+import argparse
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import ujson as json
+except ImportError:
+    import json
+from .api import API
+from .device import Device
+from .packet import UpPacket, DownPacket
+
+
+_DEVICE_FIELDS = sorted(Device._export) + ['application', 'created', 'updated']
+_PACKET_FIELDS = {
+    'packets': ['device_eui'] + UpPacket._export,
+    'down-packets': ['device_eui'] + DownPacket._export
+}
+_PAGES = {
+    'packets': 'get_up_packet_pages',
+    'down-packets': 'get_down_packet_pages'
+}
+
+
+class _CLIAPI(API):
+    """
+    API logging to stderr, stdout is reserved for the dump
+    """
+    def init_logger(self):
+        from . import logger
+        ch = logging.StreamHandler(sys.stderr)
+        ch.setLevel(self.loglevel)
+        ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logger.addHandler(ch)
+
+
+class _Writer(object):
+    """
+    Thread safe NDJSON/CSV row writer
+    """
+    def __init__(self, out, fmt, fields):
+        self.out = out
+        self.fmt = fmt
+        self.fields = fields
+        self.lock = threading.Lock()
+        self._csv = None
+        if(fmt == 'csv'):
+            self._csv = csv.DictWriter(out, fields, extrasaction='ignore')
+
+    def header(self):
+        if(self._csv):
+            self._csv.writeheader()
+
+    def rows(self, rows):
+        with self.lock:
+            for row in rows:
+                if(self._csv):
+                    self._csv.writerow(dict(
+                        (k, json.dumps(v) if isinstance(v, (dict, list)) else v) for k, v in row.items()
+                    ))
+                else:
+                    self.out.write(json.dumps(row))
+                    self.out.write('\n')
+            self.out.flush()
+
+    def block(self, f):
+        """
+        Append the whole content of f (a spooled device dump) at once
+        :return: output offset after the block, None if the output is not seekable
+        """
+        with self.lock:
+            f.seek(0)
+            shutil.copyfileobj(f, self.out)
+            self.out.flush()
+            try:
+                return self.out.tell()
+            except (IOError, OSError):
+                return None
+
+
+class _ResumeState(object):
+    """
+    Resume file holding one completed device per line: eui and the output offset after its rows
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.offset = None
+        self.lock = threading.Lock()
+        self._f = None
+
+        if(path):
+            if(os.path.exists(path)):
+                with open(path) as f:
+                    for l in f:
+                        parts = l.split()
+                        if(not parts):
+                            continue
+                        self.done.add(parts[0])
+                        if(len(parts) > 1):
+                            self.offset = max(self.offset or 0, int(parts[1]))
+            self._f = open(path, 'a')
+
+    def completed(self, eui, offset=None):
+        if(not self._f):
+            return
+        with self.lock:
+            self._f.write('%s\n' % eui if offset is None else '%s %d\n' % (eui, offset))
+            self._f.flush()
+
+    def close(self):
+        if(self._f):
+            self._f.close()
+
+
+def _iter_devices(api, args):
+    if(args.eui_file):
+        with (sys.stdin if args.eui_file == '-' else open(args.eui_file)) as f:
+            for line in f:
+                eui = line.strip()
+                if(eui and not eui.startswith('#')):
+                    yield api.get_device(eui=eui)
+    else:
+        for dev in api.get_devices(tags=args.tags):
+            if(dev is not None):
+                yield dev
+
+
+def _device_row(dev):
+    return dict((k, getattr(dev, k, None)) for k in _DEVICE_FIELDS)
+
+
+def _packet_rows(dev, pages, args):
+    for body in getattr(dev, pages)(chunksize=args.chunksize, received_after=args.received_after):
+        packets = json.loads(body.decode('utf-8') if isinstance(body, bytes) else body).get('packets') or []
+        for p in packets:
+            p['device_eui'] = dev.eui
+        yield packets
+
+
+def _dump_device(dev, pages, args, writer, state):
+    if(not state.path):
+        for rows in _packet_rows(dev, pages, args):
+            writer.rows(rows)
+        return
+
+    # resumable: the device's rows are spooled and appended in one go once complete, so an interrupted device
+    # leaves nothing behind in the output
+    spool = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+')
+    try:
+        dev_writer = _Writer(spool, writer.fmt, writer.fields)
+        for rows in _packet_rows(dev, pages, args):
+            dev_writer.rows(rows)
+        state.completed(dev.eui, writer.block(spool))
+    finally:
+        spool.close()
+
+
+def _dump_packets(api, args, writer, state):
+    pages = _PAGES[args.what]
+    devices = queue.Queue(maxsize=args.jobs * 2)
+    errors = []
+
+    def _work():
+        while(True):
+            dev = devices.get()
+            if(dev is None):
+                return
+            try:
+                _dump_device(dev, pages, args, writer, state)
+            except Exception as e:
+                logging.getLogger('firefly-API').error('dumping %s failed: %s' % (dev.eui, e))
+                errors.append(dev.eui)
+
+    workers = [threading.Thread(target=_work) for _ in range(args.jobs)]
+    for w in workers:
+        w.daemon = True
+        w.start()
+
+    try:
+        for dev in _iter_devices(api, args):
+            if(dev.eui not in state.done):
+                devices.put(dev)
+    finally:
+        for _ in workers:
+            devices.put(None)
+        for w in workers:
+            w.join()
+
+    return 1 if errors else 0
+
+
+def _open_output(args, state):
+    if(args.output == '-'):
+        return sys.stdout
+
+    if(not args.resume or not os.path.exists(args.output)):
+        return open(args.output, 'w')
+
+    out = open(args.output, 'r+')
+    if(state.path and (state.offset is not None or not state.done)):
+        # drop what was written after the last completed device (i.e. interrupted while appending)
+        out.truncate(state.offset or 0)
+    out.seek(0, os.SEEK_END)
+    return out
+
+
+def dump(args, api=None):
+    if(api is None):
+        api = _CLIAPI(token=args.token, server=args.server, port=args.port, loglevel=args.loglevel)
+
+    state = _ResumeState(args.resume if args.what != 'devices' else None)
+    out = _open_output(args, state)
+
+    try:
+        fields = _DEVICE_FIELDS if args.what == 'devices' else _PACKET_FIELDS[args.what]
+        writer = _Writer(out, args.format, fields)
+        if(not (args.resume and out is not sys.stdout and out.tell())):
+            writer.header()
+
+        if(args.what == 'devices'):
+            for dev in _iter_devices(api, args):
+                writer.rows([_device_row(dev)])
+            return 0
+
+        return _dump_packets(api, args, writer, state)
+    finally:
+        state.close()
+        if(out is not sys.stdout):
+            out.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='fireflyapi', description='firefly API command line client')
+    parser.add_argument('--token', default=os.environ.get('FIREFLY_TOKEN'),
+                        help='API token (defaults to $FIREFLY_TOKEN)')
+    parser.add_argument('--server', default=None, help='server to connect to')
+    parser.add_argument('--port', type=int, default=None, help='server port')
+    parser.add_argument('--loglevel', default='WARNING', help='log level (logs go to stderr)')
+
+    sub = parser.add_subparsers(dest='command')
+    p_dump = sub.add_parser('dump', help='stream devices or packets as NDJSON/CSV')
+    p_dump.add_argument('what', choices=['devices', 'packets', 'down-packets'])
+    p_dump.add_argument('-f', '--format', choices=['ndjson', 'csv'], default='ndjson')
+    p_dump.add_argument('-o', '--output', default='-', help='output file (defaults to stdout)')
+    p_dump.add_argument('--tags', type=lambda v: [t for t in v.split(',') if t], default=None,
+                        help='comma separated device tags')
+    p_dump.add_argument('--eui-file', default=None, help='file with one device eui per line (- for stdin)')
+    p_dump.add_argument('--received-after', default=0, help='only packets received after this date')
+    p_dump.add_argument('--chunksize', type=int, default=100, help='packets per request (1 to 100)')
+    p_dump.add_argument('-j', '--jobs', type=int, default=1, help='devices fetched in parallel')
+    p_dump.add_argument('--resume', default=None,
+                        help='state file of completed devices, completed devices are skipped and output is appended')
+    p_dump.set_defaults(func=dump)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if(not getattr(args, 'func', None)):
+        parser.print_help()
+        return 2
+
+    if(not args.token):
+        parser.error('no API token given (--token or $FIREFLY_TOKEN)')
+
+    args.loglevel = getattr(logging, str(args.loglevel).upper(), logging.WARNING)
+    args.jobs = max(1, args.jobs)
+
+    return args.func(args)
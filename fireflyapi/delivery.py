@@ -0,0 +1,298 @@
+"""
+Downlink delivery tracking: outstanding downlinks are registered with a tracker, which polls the down_packets of
+their devices in batched, rate limited sweeps (one request per device covers all of its pending downlinks, devices
+with the oldest pending downlinks first) and resolves a future per downlink once it was sent/acked or timed out.
+
+    tracker = DeliveryTracker(api, rate_limit=5)
+    futures = [tracker.send(dev, 'DEADBEEF', encoding=PAYLOAD_ENCODING.BASE16, confirmed=True) for dev in devices]
+    tracker.start()
+    for f in futures:
+        print(f.result().status)     # 'ack', 'sent' or 'timeout'
+    tracker.stop()
+"""
+import time
+import base64
+import binascii
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import PAYLOAD_ENCODING, PRIORITY, logger
+from .util import RateLimiter, to_timestamp, to_iso
+
+
+"""
+Delivery state of a downlink: status is one of 'sent', 'ack' or 'timeout', packet the matching DownPacket (None on
+timeout)
+"""
+DeliveryResult = namedtuple('DeliveryResult', ['status', 'downlink', 'packet'])
+
+
+def _packet_key(packet):
+    # identity of a down packet across polls
+    if(getattr(packet, 'id', None) is not None):
+        return packet.id
+    return packet.received_at, packet.frame_counter, str(packet.payload or '').lower()
+
+
+def _hex_payload(payload, encoding):
+    # firefly reports down packet payloads hex encoded
+    if(payload is None):
+        return None
+    if(isinstance(payload, bytes)):
+        payload = payload.decode('latin-1') if encoding != PAYLOAD_ENCODING.UTF_8 else payload.decode('utf-8')
+    if(encoding == PAYLOAD_ENCODING.BASE64):
+        return binascii.hexlify(base64.b64decode(payload)).decode('ascii')
+    if(encoding == PAYLOAD_ENCODING.UTF_8):
+        return binascii.hexlify(payload.encode('utf-8')).decode('ascii')
+    return payload.lower()
+
+
+class Downlink(object):
+    """
+    Outstanding downlink
+
+    :param device    : Device the downlink was queued for
+    :param payload   : payload as hex string
+    :param queued_at : unix seconds the downlink was queued
+    :param confirmed : wait for the ack (confirmed downlink), otherwise done once sent
+    :param packet_id : id of the queued packet if the API returned one
+    :param callback  : callable(DeliveryResult) invoked on every status change
+    """
+
+    def __init__(self, device, payload, queued_at, confirmed=False, packet_id=None, callback=None):
+        self.device = device
+        self.payload = payload
+        self.queued_at = queued_at
+        self.confirmed = confirmed
+        self.packet_id = packet_id
+        self.callback = callback
+        self.status = None
+        # key of the down packet matched to this downlink (see _packet_key), kept across sweeps
+        self.packet_key = None
+        self.future = Future()
+
+    @property
+    def final_status(self):
+        return 'ack' if self.confirmed else 'sent'
+
+
+class DeliveryTracker(object):
+    """
+    Batched delivery tracking of queued downlinks
+
+    :param api         : API reference
+    :param timeout     : seconds after which a downlink not sent/acked is resolved as 'timeout'
+    :param interval    : seconds between two sweeps of the background thread
+    :param rate_limit  : maximum down_packets requests per second of the tracker, None for no limit
+    :param sweep_size  : maximum number of devices polled per sweep
+    :param workers     : concurrent requests per sweep
+    :param clock_skew  : seconds of clock difference tolerated between this host and firefly
+    """
+
+    def __init__(self, api, timeout=600, interval=5, rate_limit=None, sweep_size=100, workers=4, clock_skew=60):
+        self.api = api
+        self.timeout = timeout
+        self.interval = interval
+        self.sweep_size = sweep_size
+        self.workers = workers
+        self.clock_skew = clock_skew
+        self._limiter = RateLimiter(rate_limit) if rate_limit else None
+        self._lock = threading.Lock()
+        # eui -> list of Downlinks in queue order
+        self._pending = {}
+        # eui -> {packet key: received_at} of down packets already matched to a downlink
+        self._claimed = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'requests': 0, 'sent': 0, 'ack': 0, 'timeout': 0}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(v) for v in self._pending.values())
+
+    def track(self, device, payload, encoding=PAYLOAD_ENCODING.BASE16, queued_at=None, confirmed=False,
+              packet_id=None, callback=None):
+        """
+        Register an already queued downlink
+        :param device    : Device
+        :param payload   : payload as queued
+        :param encoding  : encoding of payload
+        :param queued_at : unix seconds the downlink was queued, defaults to now
+        :param confirmed : wait for the ack, otherwise the downlink is done once sent
+        :param packet_id : id of the queued packet (if returned by send_packet)
+        :param callback  : callable(DeliveryResult) invoked on every status change
+        :return: concurrent.futures.Future resolving to the final DeliveryResult
+        """
+        dl = Downlink(device, _hex_payload(payload, encoding), queued_at or time.time(), confirmed, packet_id,
+                      callback)
+        with self._lock:
+            self._pending.setdefault(str(device.eui).lower(), []).append(dl)
+        return dl.future
+
+    def send(self, device, payload, encoding=PAYLOAD_ENCODING.BASE16, port=1, force_encode=False, confirmed=False,
+             callback=None):
+        """
+        Queue a downlink (see Device.send_packet) and track it
+        :return: concurrent.futures.Future resolving to the final DeliveryResult
+        """
+        queued_at = time.time()
+        response = device.send_packet(payload, encoding=encoding, port=port, force_encode=force_encode,
+                                      confirmed=confirmed)
+        if(force_encode):
+            from .device import _encode_payload
+            payload = _encode_payload(payload, encoding)
+
+        packet = (response or {}).get('packet') or {}
+        return self.track(device, payload, encoding, queued_at, confirmed, packet.get('id'), callback)
+
+    def _due(self):
+        # devices ordered by their oldest pending downlink
+        with self._lock:
+            order = sorted(self._pending.items(), key=lambda e: e[1][0].queued_at)
+        return order[:self.sweep_size]
+
+    def _poll(self, eui, downlinks):
+        if(self._limiter is not None):
+            self._limiter.acquire()
+
+        since = min(dl.queued_at for dl in downlinks) - self.clock_skew
+        limit = min(max(2 * len(downlinks), 10), 100)
+        _, packets = downlinks[0].device.get_down_packets(limit_to_last=limit, received_after=to_iso(since),
+                                                          priority=PRIORITY.NORMAL)
+        with self._lock:
+            self.stats['requests'] += 1
+        return [p for p in packets if p is not None]
+
+    def _match(self, eui, downlinks, packets):
+        # oldest packet first, every packet confirms at most one downlink (oldest matching first), also across sweeps:
+        # a downlink keeps its packet, packets matched before are not matched to other downlinks
+        packets = sorted(packets, key=lambda p: to_timestamp(p.received_at))
+        with self._lock:
+            claimed = self._claimed.setdefault(eui, {})
+            ret = []
+            for dl in downlinks:
+                for p in packets:
+                    key = _packet_key(p)
+                    if(dl.packet_key is not None):
+                        if(key != dl.packet_key):
+                            continue
+                    elif(key in claimed):
+                        continue
+                    elif(dl.packet_id is not None and getattr(p, 'id', None) is not None):
+                        if(p.id != dl.packet_id):
+                            continue
+                    elif(str(p.payload or '').lower() != dl.payload or
+                         to_timestamp(p.received_at) < dl.queued_at - self.clock_skew):
+                        continue
+                    dl.packet_key = key
+                    claimed[key] = to_timestamp(p.received_at)
+                    ret.append((dl, p))
+                    break
+        return ret
+
+    def _prune_claims(self, now):
+        # packets older than any pending downlink (minus clock skew) are not polled anymore
+        with self._lock:
+            for eui in list(self._claimed):
+                dls = self._pending.get(eui)
+                since = min(dl.queued_at for dl in dls) if dls else now
+                claimed = dict((k, ts) for k, ts in self._claimed[eui].items() if ts >= since - self.clock_skew)
+                if(claimed):
+                    self._claimed[eui] = claimed
+                else:
+                    del self._claimed[eui]
+
+    def _advance(self, dl, packet):
+        status = 'ack' if packet.ack else ('sent' if packet.sent else None)
+        if(status is None or status == dl.status):
+            return False
+
+        dl.status = status
+        result = DeliveryResult(status, dl, packet)
+        with self._lock:
+            self.stats[status] += 1
+        if(dl.callback):
+            dl.callback(result)
+        if(status == 'ack' or status == dl.final_status):
+            dl.future.set_result(result)
+            return True
+        return False
+
+    def _expire(self, now):
+        expired = []
+        with self._lock:
+            for eui, dls in list(self._pending.items()):
+                keep = [dl for dl in dls if now - dl.queued_at < self.timeout]
+                expired.extend(dl for dl in dls if now - dl.queued_at >= self.timeout)
+                if(keep):
+                    self._pending[eui] = keep
+                else:
+                    del self._pending[eui]
+            self.stats['timeout'] += len(expired)
+
+        for dl in expired:
+            result = DeliveryResult('timeout', dl, None)
+            if(dl.callback):
+                dl.callback(result)
+            dl.future.set_result(result)
+
+    def sweep(self):
+        """
+        Poll the devices with the oldest pending downlinks once and resolve delivered/timed out downlinks
+        :return: number of downlinks still pending
+        """
+        due = self._due()
+        if(due):
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                polled = [(eui, dls, pool.submit(self._poll, eui, list(dls))) for eui, dls in due]
+
+            for eui, dls, fut in polled:
+                err = fut.exception()
+                if(err is not None):
+                    logger.warn('delivery tracking of %s failed: %s' % (eui, err))
+                    continue
+
+                done = set(id(dl) for dl, p in self._match(eui, dls, fut.result()) if self._advance(dl, p))
+                if(done):
+                    with self._lock:
+                        remaining = [dl for dl in self._pending.get(eui, []) if id(dl) not in done]
+                        if(remaining):
+                            self._pending[eui] = remaining
+                        else:
+                            self._pending.pop(eui, None)
+
+        now = time.time()
+        self._expire(now)
+        self._prune_claims(now)
+        return len(self)
+
+    def run(self, until_done=True):
+        """
+        Sweep every interval seconds in the calling thread
+        :param until_done: return once no downlinks are pending, otherwise run until stop()
+        """
+        while(not self._stop.is_set()):
+            started = time.time()
+            if(not self.sweep() and until_done):
+                return
+            self._stop.wait(max(self.interval - (time.time() - started), 0))
+
+    def start(self):
+        """
+        Sweep in a background thread until stop()
+        """
+        if(self._thread is not None):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(False,), name='fireflyapi-delivery')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread
+        """
+        self._stop.set()
+        if(self._thread is not None):
+            self._thread.join()
+            self._thread = None
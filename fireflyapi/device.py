@@ -1,10 +1,11 @@
-from . import HTTP_VERBS, PAYLOAD_ENCODING, logger
+from . import HTTP_VERBS, PAYLOAD_ENCODING, PRIORITY, logger
 import time
 from datetime import datetime
 from .api_entity import APIEntity, exists, not_exists
 from .observable import Observable
-from .api_exception import APIException, EntityAlreadyCreatedError, EntityNotFoundError
+from .api_exception import APIException, EntityAlreadyCreatedError, EntityNotFoundError, DeviceValidationError
 from .util import is_string
+from .validation import check_formats, validate_device
 import base64
 import numbers
 import struct
@@ -73,29 +74,44 @@ class Device(Observable, APIEntity):
 
     def __init__(self, api=None, **args):
         self.api = api
-        # TODO: check for required fields !
 
-        if('created_at' in args):
-            self.created = int(time.mktime(datetime.strptime(args.pop('created_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
+        args = _parse_device(args)
+        if(not args.get('_exists')):
+            # devices delivered by the API are taken as they are
+            _argcheck(args)
 
-        if('updated_at' in args):
-            self.updated = int(time.mktime(datetime.strptime(args.pop('updated_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
+        #this can be dangerous ;)
+        self._replace_state(args)
 
-        if('tags' in args):
-            if(not isinstance(args['tags'],list) and isinstance(args['tags'],basestring)):
-                self.tags = args.pop('tags').split(',')
+    def _update(self, args):
+        """
+        Update members in place from a (re-)fetched API dict (i.e. a listing resolving to this shared instance), fields
+        with unsaved local changes (see get_changes) keep their local value until update() or pull()
+        """
+        self._merge_state(_parse_device(args))
 
-        _argcheck(args)
+    def resolve_application(self):
+        """
+        Resolve the application id to the API's shared Application instance (the listing is fetched at most once)
+        :return: Application or None
+        """
+        return self.api.get_application(_ref_id(self.application))
 
-        #this can be dangerous ;)
-        self.__dict__.update(args)
-        self._not_dirty()
+    def resolve_device_class(self):
+        """
+        Resolve the device class reference to the API's shared DeviceClass instance (listing is fetched at most once)
+        :return: DeviceClass or None
+        """
+        ref = _ref_id(self.device_class if self.device_class is not None else getattr(self, 'device_class_id', None))
+        if(ref is None):
+            return None
+        return self.api.get_device_class(ref)
 
-    def to_json(self, target=None):
-        if(target=='update'):
-            return self.to_json(target, exclude=['created', 'updated'])
+    def to_json(self, target=None, exclude=None):
+        return json.dumps(self._json_dict(target, exclude))
 
-        else:
+    def _json_dict(self, target=None, exclude=None):
+        with self.lock():
             ret = {
                     'eui': self.eui,
                     'name': self.name,
@@ -110,18 +126,15 @@ class Device(Observable, APIEntity):
                     'class_c': self.class_c
             }
 
-        return json.dumps(ret)
+        if(target=='update'):
+            exclude = ['created_at', 'updated_at'] + list(exclude or [])
 
-    @exists
-    def get_up_packets(self, limit_to_last=1, offset=0, received_after=0):
-        """
-        Get device's down packets
-        :param limit_to_last:   1 to 100
-        :param offset:          offset value, ignore packets #<offset
-        :param received_after:  only packets received after a specific date
-        :return: a tuple containing a tuple with the packets start index (regarding offset/limit) and device's total
-                 packet count as well as a generator providing fetched packets
-        """
+        for k in exclude or []:
+            ret.pop(k, None)
+
+        return ret
+
+    def _packets_request(self, kind, limit_to_last=1, offset=0, received_after=0, priority=None):
         query = {
             'limit_to_last': limit_to_last
         }
@@ -133,60 +146,89 @@ class Device(Observable, APIEntity):
             #TODO: support datetime inst
             query['received_after'] = received_after
 
-        res = self.api.call(HTTP_VERBS.GET, 'devices/eui/%s/packets' % self.eui, query=query)
+        res = self.api.call(HTTP_VERBS.GET, 'devices/eui/%s/%s' % (self.eui, kind), query=query, priority=priority)
 
         if (res.status_code == 404):
             raise EntityNotFoundError(res.json())
 
-        resdata = res.json()
+        return res
+
+    @exists
+    def get_up_packets(self, limit_to_last=1, offset=0, received_after=0, priority=None):
+        """
+        Get device's up packets
+        :param limit_to_last:   1 to 100
+        :param offset:          offset value, ignore packets #<offset
+        :param received_after:  only packets received after a specific date
+        :param priority:        request PRIORITY class (see API.call)
+        :return: a tuple containing a tuple with the packets start index (regarding offset/limit) and device's total
+                 packet count as well as a generator providing fetched packets
+        """
+        resdata = self._packets_request('packets', limit_to_last, offset, received_after, priority).json()
         return (resdata['count']-offset-limit_to_last, resdata['count']), _pkg_gen(self, resdata['packets'])
 
     @exists
-    def get_down_packets(self, limit_to_last=1, offset=0, received_after=0):
+    def get_down_packets(self, limit_to_last=1, offset=0, received_after=0, priority=None):
         """
         Get device's down packets
         :param limit_to_last:   1 to 100
         :param offset:          offset value, ignore packets #<offset
         :param received_after:  only packets received after a specific date
+        :param priority:        request PRIORITY class (see API.call)
         :return: a tuple containing a tuple with the packets start index (regarding offset/limit) and device's total
                  packet count as well as a generator providing fetched packets
         """
-        query = {
-            'limit_to_last': limit_to_last
-        }
+        resdata = self._packets_request('down_packets', limit_to_last, offset, received_after, priority).json()
 
-        if (offset > 0):
-            query['offset'] = offset
-
-        if (received_after):
-            # TODO: support datetime inst
-            query['received_after'] = received_after
+        logger.debug('got ( %s / %s ) packets' % (resdata['count']-offset-limit_to_last, resdata['count']))
 
-        res = self.api.call(HTTP_VERBS.GET, 'devices/eui/%s/down_packets' % self.eui, query=query)
+        return (resdata['count']-offset-limit_to_last, resdata['count']), _pkg_gen(self, resdata['packets'], _up=False)
 
-        if(res.status_code==404):
-            raise EntityNotFoundError(res.json())
+    def _packet_pages(self, kind, chunksize, received_after):
+        priority = self.api.current_priority(PRIORITY.BULK)
+        count = self._packets_request(kind, 1, 0, received_after, priority).json()['count']
+        offset = 0
+        while(offset < count):
+            limit = min(chunksize, count - offset)
+            yield self._packets_request(kind, limit, offset, received_after, priority).content
+            offset += limit
 
-        resdata = res.json()
-
-        logger.debug('got ( %s / %s ) packets' % (resdata['count']-offset-limit_to_last, resdata['count']))
+    @exists
+    def get_up_packet_pages(self, chunksize=100, received_after=0):
+        """
+        Raw (undecoded) up-packet pages, newest page first, requested at bulk priority. Meant for pipelines decoding
+        the json elsewhere (i.e. in a process pool, see pipeline.PagePipeline)
+        :param chunksize      : packets per page (1 to 100)
+        :param received_after : only packets received after a specific date
+        :return: generator providing the raw response bodies
+        """
+        return self._packet_pages('packets', chunksize, received_after)
 
-        return (resdata['count']-offset-limit_to_last, resdata['count']), _pkg_gen(self, resdata['packets'])
+    @exists
+    def get_down_packet_pages(self, chunksize=100, received_after=0):
+        """
+        Raw (undecoded) down-packet pages, newest page first
+        :param chunksize      : packets per page (1 to 100)
+        :param received_after : only packets received after a specific date
+        :return: generator providing the raw response bodies
+        """
+        return self._packet_pages('down_packets', chunksize, received_after)
 
     @exists
     def get_all_up_packets(self, chunksize=100, chunkwait=1):
         """
         contineous stream all device up-packets, will lead to a lot of requests (depending on the total packet count and
-        chunksize)
+        chunksize), requested at bulk priority
         :param chunksize : how many packets to fetch at a time
         :param chunkwait : how many seconds to wait after requesting the next chunk
         :return: a generator for all packets of this device
         """
-        count, last = self.get_up_packets()
+        priority = self.api.current_priority(PRIORITY.BULK)
+        count, last = self.get_up_packets(priority=priority)
         ucnt = 0
         dcnt = count[1]
         while(dcnt-chunksize>0):
-            pc, pkts = self.get_up_packets(limit_to_last=chunksize, offset=ucnt)
+            pc, pkts = self.get_up_packets(limit_to_last=chunksize, offset=ucnt, priority=priority)
             for p in pkts:
                 yield p
             ucnt += chunksize
@@ -204,6 +246,7 @@ class Device(Observable, APIEntity):
 
         self._exists = False
         self._not_dirty()
+        self.api._register_device(self, remove=True)
 
     @exists
     def update(self):
@@ -211,8 +254,13 @@ class Device(Observable, APIEntity):
         Update this device using the API
         """
         logger.info('updating device %s' % self.eui)
-        self.api.call(HTTP_VERBS.PUT, 'devices/eui/%s' % self.eui, data=self.to_json('update'))
-        self._not_dirty()
+        # body and changes are taken together, the request is made unlocked: changes made by other threads meanwhile
+        # stay dirty
+        with self.lock():
+            data = self._update_request()
+            snapshot = self._snapshot_changes()
+        self.api.call(HTTP_VERBS.PUT, 'devices/eui/%s' % self.eui, data=data)
+        self._mark_saved(snapshot)
 
     @exists
     def pull(self):
@@ -226,16 +274,20 @@ class Device(Observable, APIEntity):
         if (not 'device' in respdata):
             raise APIException('no such device eui="%s"' % self.eui)
 
-        self.__dict__.update(respdata['device'])
+        # explicit refresh: unsaved local changes are discarded
+        self._replace_state(_parse_device(respdata['device']))
 
     @exists
-    def send_packet(self, payload, encoding=None, port=1, force_encode=False):
+    def send_packet(self, payload, encoding=None, port=1, force_encode=False, confirmed=False):
         """
         Sends a packet to the device
         :param payload:         Payload string. If encoding is forced, payload might be anything native(s) to objects
+                                or raw bytes (i.e. packed by payload.PayloadSchema)
         :param encoding:        Payload encoding Base16, Base64, UTF-8
         :param port:            Package port number
         :param force_encode:    Encode payload to match encoding
+        :param confirmed:       Confirmed downlink (acknowledged by the device)
+        :return: decoded API response (see delivery.DeliveryTracker to follow up on the delivery)
         """
         if(not payload):
             raise APIException('empty payload')
@@ -252,12 +304,17 @@ class Device(Observable, APIEntity):
 
         data = {
             'encoding': encoding,
-            'payload': _encode_payload(payload) if force_encode else payload,
+            'payload': _encode_payload(payload, encoding) if force_encode else payload,
             'port': port
         }
+        if(confirmed):
+            data['confirmed'] = True
 
-        response = self.api.call(HTTP_VERBS.POST, 'devices/eui/%s/packet' % self.eui, data=data)
-        logger.info('packet send : %s' % response.json())
+        response = self.api.call(HTTP_VERBS.POST, 'devices/eui/%s/packet' % self.eui, data=data,
+                                 priority=self.api.current_priority(PRIORITY.INTERACTIVE))
+        ret = response.json()
+        logger.info('packet send : %s' % ret)
+        return ret
 
     def export(self):
         return self._export
@@ -265,12 +322,37 @@ class Device(Observable, APIEntity):
     @not_exists
     def create(self):
         """
-        Create this device by Posting to the API
+        Create this device by Posting to the API. The device is validated first (see validation.validate_device),
+        DeviceValidationError is raised without a request if it is invalid.
         """
         if(not self.api.orga_id):
             raise APIException('No organization id specified in API')
 
+        with self.lock():
+            if(self._exists):
+                raise APIException('%s is already created remotely' % self.__class__.__name__)
+
+            issues = validate_device(dict((k, getattr(self, k)) for k in self._export))
+            if(issues):
+                raise DeviceValidationError(issues)
+
+            # claimed by this call, the request is made unlocked
+            self._exists = True
+            data = self._create_request()
+            snapshot = self._snapshot_changes()
+
+        try:
+            res = self.api.call(HTTP_VERBS.POST, 'devices', data=data)
+        except Exception:
+            self._exists = False
+            raise
 
+        # members changed by other threads meanwhile keep their local value and stay dirty
+        self._merge_state(_parse_device(res.json()['device']))
+        self._mark_saved(snapshot)
+        self.api._register_device(self)
+
+    def _create_request(self):
         reqdata = {
             'organization': self.api.orga_id,
             'device': {
@@ -294,21 +376,69 @@ class Device(Observable, APIEntity):
             if (self.application):
                 reqdata['application'] = self.application
 
-        res = self.api.call(HTTP_VERBS.POST, 'devices', data=reqdata)
+        return reqdata
 
-        self._exists = True
-        self.__dict__.update(res.json()['device'])
-        self._not_dirty()
+    def _update_request(self):
+        # a dict (encoded by the transport), tags and application like in _create_request
+        reqdata = self._json_dict('update')
+        reqdata['tags'] = ','.join(self.tags or [])
+        if(self.application):
+            reqdata['application'] = _ref_id(self.application)
+        return reqdata
+
+
+def _parse_device(args):
+    """
+    Convert a device dict as delivered by the API to member values
+    """
+    args = dict(args)
+    if('created_at' in args):
+        args['created'] = int(time.mktime(datetime.strptime(args.pop('created_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
+
+    if('updated_at' in args):
+        args['updated'] = int(time.mktime(datetime.strptime(args.pop('updated_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
+
+    if('tags' in args):
+        if(not isinstance(args['tags'],list) and is_string(args['tags'])):
+            args['tags'] = args.pop('tags').split(',')
+
+    return args
 
 
-def _argcheck(*kwargs):
-    # TODO: check **args when creating or leave this to the API ?
-    pass
+def _ref_id(ref):
+    # references are delivered either as plain id or as nested dict
+    if(isinstance(ref, dict)):
+        return ref.get('id')
+    return ref
+
+
+def _argcheck(args):
+    # formats only, required fields are checked on create()
+    issues = check_formats(args)
+    if(issues):
+        raise DeviceValidationError(issues)
+
+def _payload_bytes(payload):
+    # numbers are packed big endian (network order, like the BASE16 encoding of integers)
+    if(isinstance(payload, bytes)):
+        return payload
+    if(is_string(payload)):
+        return payload.encode('utf-8')
+    if(isinstance(payload, bool) or not isinstance(payload, numbers.Number)):
+        return None
+    if(isinstance(payload, numbers.Integral)):
+        if(-0x80000000 <= payload <= 0x7FFFFFFF):
+            return struct.pack('>i', payload)
+        return struct.pack('>q', payload)
+    return struct.pack('>f', payload)
+
 
 # TODO: there are dozens of more variants to encode a varible type of data, investigate and implement some more ;)
 def _encode_payload(payload, encoding):
     if(encoding == PAYLOAD_ENCODING.UTF_8):
-        if(is_string(payload)):
+        if(isinstance(payload, bytes)):
+            return payload.decode('utf-8')
+        elif(is_string(payload)):
             if(not PY3):
                 return unicode(payload)
             else:
@@ -317,26 +447,21 @@ def _encode_payload(payload, encoding):
             return str(payload)
         else:
             raise APIException('given payload is not encodeable using %s' % encoding)
-    elif(encoding == PAYLOAD_ENCODING.BASE64):
-        if (is_string(payload)):
-            return base64.b64encode(payload)
-        elif(isinstance(payload, int)):
-            return base64.b64encode(struct.pack('i', payload))
-        elif(isinstance(payload, float)):
-            return base64.b64encode(struct.pack('f', payload))
-        elif(isinstance(payload, numbers.Number)):
-            return base64.b64encode(struct.pack('q', payload))
-        else:
-            raise APIException('given payload is not encodeable using %s' % encoding)
+    elif(encoding == PAYLOAD_ENCODING.BASE16 and isinstance(payload, numbers.Integral)
+         and not isinstance(payload, bool) and payload >= 0):
+        # keep whole byte digits, firefly expects an even number of hex characters
+        encoded = format(payload, 'x')
+        return encoded if len(encoded) % 2 == 0 else '0' + encoded
+
+    raw = _payload_bytes(payload)
+    if(raw is None):
+        raise APIException('given payload is not encodeable using %s' % encoding)
+    if(encoding == PAYLOAD_ENCODING.BASE64):
+        return base64.b64encode(raw).decode('ascii')
     elif(encoding == PAYLOAD_ENCODING.BASE16):
-        if (is_string(payload)):
-            return binascii.hexlify(payload)
-        elif(isinstance(payload, (int, long))):
-            return format(payload, 'x')
-        elif (isinstance(payload, float)):
-            return binascii.hexlify(struct.pack('f', payload))
-        elif (isinstance(payload, numbers.Number)):
-            return binascii.hexlify(struct.pack('q', payload))
+        return binascii.hexlify(raw).decode('ascii')
+    raise APIException('unknown payload encoding')
+
 
 def _pkg_gen(device, pkgs, _up=True):
     if(not pkgs):
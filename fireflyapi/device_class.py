@@ -24,6 +24,13 @@ class DeviceClass(APIEntity):
 
     def __init__(self, api=None, **args):
         self.api = api
+        self._exists = True
+        self._update(args)
+
+    def _update(self, args):
+        """
+        Update members in place from a (re-)fetched API dict
+        """
         if ('inserted_at' in args):
             self.created = int(
                 time.mktime(datetime.strptime(args.pop('inserted_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
@@ -32,10 +39,8 @@ class DeviceClass(APIEntity):
             self.updated = int(
                 time.mktime(datetime.strptime(args.pop('updated_at'), '%Y-%m-%dT%H:%M:%S').timetuple()))
 
-        self._exists = True
         self.__dict__.update(args)
 
-
     def export(self):
         return self._export
 
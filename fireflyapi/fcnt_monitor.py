@@ -0,0 +1,227 @@
+from collections import namedtuple
+from . import PRIORITY
+from .util import to_timestamp
+
+
+"""
+Frame counter event, kind is one of 'gap', 'late', 'duplicate', 'reset', 'rollover'. For gaps fcnt is the first missing
+counter and count the number of missing frames.
+"""
+FcntEvent = namedtuple('FcntEvent', ['eui', 'kind', 'fcnt', 'count'])
+
+"""
+Per device frame counter statistics
+"""
+FcntStats = namedtuple('FcntStats', ['eui', 'received', 'lost', 'duplicates', 'resets', 'rollovers', 'last_fcnt',
+                                     'loss_rate'])
+
+
+class _CounterState(object):
+    """
+    Compact per device state. last is the rollover extended counter, bitmap bit i is set if counter (last - i) has been
+    received, first is the lowest counter tracked since the last reset.
+    """
+    __slots__ = ['first', 'last', 'bitmap', 'received', 'lost', 'duplicates', 'resets', 'rollovers']
+
+    def __init__(self, fcnt):
+        self.first = fcnt
+        self.last = fcnt
+        self.bitmap = 1
+        self.received = 1
+        self.lost = 0
+        self.duplicates = 0
+        self.resets = 0
+        self.rollovers = 0
+
+
+def oldest_first(device, chunksize=100, received_after=0):
+    """
+    Up-packets of a device in ascending order (oldest first, one page held at a time) as FrameCounterMonitor expects
+    them, requested at bulk priority
+    :param device         : Device
+    :param chunksize      : packets per request
+    :param received_after : only packets received after a specific date
+    :return: generator providing UpPackets
+    """
+    priority = device.api.current_priority(PRIORITY.BULK)
+    (_, count), _ = device.get_up_packets(limit_to_last=1, received_after=received_after, priority=priority)
+    # pos counts the packets yielded, positions from the oldest packet don't move when new packets arrive. Packets
+    # arriving meanwhile are not part of the history (end).
+    end = count
+    pos = 0
+    last = None
+    while(pos < end):
+        limit = min(chunksize, end - pos)
+        (_, latest), packets = device.get_up_packets(limit_to_last=limit, offset=max(count - pos - limit, 0),
+                                                     received_after=received_after, priority=priority)
+        if(latest != count):
+            # packets arrived since count was taken, so the (newest first) offset missed the page: request it again
+            count = latest
+            continue
+        for p in sorted((p for p in packets if p is not None), key=lambda p: to_timestamp(p.received_at)):
+            ts = to_timestamp(p.received_at)
+            # the overlap with the previous page was yielded already
+            if(last is not None and ts <= last):
+                continue
+            last = ts
+            pos += 1
+            yield p
+            if(pos >= end):
+                return
+
+
+class FrameCounterMonitor(object):
+    """
+    Fleet wide frame counter gap/duplicate detection on up-packet streams. Every device is tracked in a sliding bitmap
+    of the last <window> counters, so late (out of order) packets within the window are recognized as recovered gaps
+    and repeated counters as duplicates (replays). Streams have to be in ascending order (as received), only packets
+    up to <window> frames late are tolerated. Device.get_all_up_packets pages newest first and must not be fed in
+    directly, use oldest_first() for device histories.
+
+    :param window       : sliding window size in frames
+    :param counter_bits : counter width reported by the network, 16 or 32
+    :param max_gap      : largest forward jump accepted as packet loss, bigger jumps to a small counter are
+                          treated as counter resets (i.e. a device rejoin), see LoRaWAN MAX_FCNT_GAP
+    """
+
+    def __init__(self, window=256, counter_bits=32, max_gap=16384):
+        if(counter_bits not in (16, 32)):
+            raise ValueError('counter_bits must be 16 or 32')
+
+        self.window = window
+        self.modulus = 1 << counter_bits
+        self.max_gap = max_gap
+        self._mask = (1 << window) - 1
+        self._devices = {}
+
+    def add(self, packet):
+        """
+        Track a single up-packet
+        :param packet: UpPacket (None is ignored)
+        :return: list of FcntEvents caused by this packet
+        """
+        if(packet is None):
+            return []
+
+        return self.add_counter(getattr(packet.device, 'eui', None), packet.fcnt)
+
+    def add_counter(self, eui, fcnt):
+        """
+        Track a raw (eui, fcnt) observation
+        :return: list of FcntEvents
+        """
+        fcnt = int(fcnt) % self.modulus
+        state = self._devices.get(eui)
+        if(state is None):
+            self._devices[eui] = _CounterState(fcnt)
+            return []
+
+        events = []
+        raw_last = state.last % self.modulus
+        diff = fcnt - raw_last
+
+        if(diff < 0 and -diff >= self.window):
+            forward = (fcnt - raw_last) % self.modulus
+            if(raw_last >= self.modulus - self.max_gap and forward <= self.max_gap):
+                state.rollovers += 1
+                events.append(FcntEvent(eui, 'rollover', fcnt, 1))
+                diff = forward
+            elif(fcnt < self.max_gap):
+                return events + self._reset(eui, state, fcnt)
+            else:
+                # far behind, outside of the window: can't tell, count as replay
+                state.duplicates += 1
+                return [FcntEvent(eui, 'duplicate', fcnt, 1)]
+
+        if(diff > 0):
+            if(diff > self.max_gap and fcnt < self.max_gap):
+                return events + self._reset(eui, state, fcnt)
+
+            if(diff > 1):
+                state.lost += diff - 1
+                events.append(FcntEvent(eui, 'gap', (raw_last + 1) % self.modulus, diff - 1))
+
+            state.last += diff
+            state.bitmap = ((state.bitmap << diff) | 1) & self._mask
+            state.received += 1
+        else:
+            bit = 1 << -diff
+            counter = state.last + diff
+            if(state.bitmap & bit):
+                state.duplicates += 1
+                events.append(FcntEvent(eui, 'duplicate', fcnt, 1))
+            elif(counter < state.first):
+                # older than anything seen so far (i.e. newest first pages), extends the tracked range backwards
+                if(state.first - counter > 1):
+                    state.lost += state.first - counter - 1
+                    events.append(FcntEvent(eui, 'gap', (fcnt + 1) % self.modulus, state.first - counter - 1))
+                state.first = counter
+                state.bitmap |= bit
+                state.received += 1
+            else:
+                state.bitmap |= bit
+                state.lost -= 1
+                state.received += 1
+                events.append(FcntEvent(eui, 'late', fcnt, 1))
+
+        return events
+
+    def _reset(self, eui, state, fcnt):
+        state.first = fcnt
+        state.last = fcnt
+        state.bitmap = 1
+        state.received += 1
+        state.resets += 1
+        return [FcntEvent(eui, 'reset', fcnt, 1)]
+
+    def track(self, packets, on_event=None):
+        """
+        Pass-through wrapper for packet iterators, i.e.
+            for p in monitor.track(oldest_first(dev)): ...
+        :param packets  : iterable of UpPackets
+        :param on_event : callable invoked for every FcntEvent
+        :return: generator yielding the unchanged packets
+        """
+        for p in packets:
+            events = self.add(p)
+            if(on_event):
+                for e in events:
+                    on_event(e)
+            yield p
+
+    def events(self, packets):
+        """
+        :param packets: iterable of UpPackets
+        :return: generator yielding FcntEvents as packets stream in
+        """
+        for p in packets:
+            for e in self.add(p):
+                yield e
+
+    def stats(self, eui):
+        """
+        :param eui: device eui
+        :return: FcntStats or None if device has not been seen
+        """
+        state = self._devices.get(eui)
+        if(state is None):
+            return None
+
+        expected = state.received + state.lost
+        return FcntStats(
+            eui, state.received, state.lost, state.duplicates, state.resets, state.rollovers,
+            state.last % self.modulus, float(state.lost) / expected if expected else 0.0
+        )
+
+    def report(self, min_loss_rate=0.0):
+        """
+        :param min_loss_rate: only report devices with at least this loss rate
+        :return: generator of FcntStats, one per tracked device
+        """
+        for eui in self._devices:
+            s = self.stats(eui)
+            if(s.loss_rate >= min_loss_rate):
+                yield s
+
+    def __len__(self):
+        return len(self._devices)
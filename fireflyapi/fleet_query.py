@@ -0,0 +1,146 @@
+import heapq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from . import PRIORITY
+from .util import to_timestamp, to_iso
+
+
+class _DeviceStream(object):
+    """
+    Time ordered up-packet stream of a single device. Pages are requested oldest first, the next page is always
+    prefetched on the shared pool while the current one is consumed, so at most two pages per device are held.
+    """
+
+    def __init__(self, device, start, end, chunksize, pool):
+        self.device = device
+        self.start = start
+        self.end = end
+        self.chunksize = chunksize
+        self.pool = pool
+        self.count = None
+        self.page = 0
+        self.buffer = deque()
+        self.last = None
+        self.last_keys = set()
+        self.done = False
+        self.future = pool.submit(self._fetch_first)
+
+    def _fetch_first(self):
+        (_, self.count), _ = self.device.get_up_packets(limit_to_last=1, received_after=self._received_after(),
+                                                        priority=PRIORITY.BULK)
+        return self._fetch_page(0)
+
+    def _received_after(self):
+        return to_iso(self.start) if self.start else 0
+
+    def _fetch_page(self, page):
+        hi = self.count - page * self.chunksize
+        if(hi <= 0):
+            return None
+        offset = max(hi - self.chunksize, 0)
+        _, packets = self.device.get_up_packets(limit_to_last=hi - offset, offset=offset,
+                                                received_after=self._received_after(), priority=PRIORITY.BULK)
+        ret = [(to_timestamp(p.received_at), p) for p in packets if p is not None]
+        ret.sort(key=lambda e: e[0])
+        return ret
+
+    def _next_page(self):
+        page = self.future.result()
+        self.future = None
+        if(page is None):
+            return False
+
+        self.page += 1
+        self.future = self.pool.submit(self._fetch_page, self.page)
+        self.buffer.extend(page)
+        return True
+
+    def next(self):
+        """
+        :return: tuple (received_at, UpPacket) or None if exhausted
+        """
+        while(not self.done):
+            if(not self.buffer and not self._next_page()):
+                self.close()
+                break
+
+            while(self.buffer):
+                ts, p = self.buffer.popleft()
+                if(self.start and ts < self.start):
+                    continue
+                if(self.end is not None and ts >= self.end):
+                    self.close()
+                    return None
+
+                # pages may overlap if packets arrive meanwhile (offsets count from the newest packet)
+                key = (p.fcnt, p.received_at)
+                if(self.last is not None and ts < self.last):
+                    continue
+                if(ts == self.last):
+                    if(key in self.last_keys):
+                        continue
+                else:
+                    self.last = ts
+                    self.last_keys = set()
+                self.last_keys.add(key)
+                return ts, p
+
+        return None
+
+    def close(self):
+        self.done = True
+        self.buffer.clear()
+        if(self.future is not None):
+            self.future.cancel()
+            self.future = None
+
+
+def query_uplinks(api, start, end=None, tags=None, devices=None, workers=16, chunksize=100):
+    """
+    Fleet wide time window query: all up-packets of the given devices received within [start, end), merged into a
+    single stream ordered by received_at. Per device fetches run concurrently, the per device streams are merged
+    lazily (k-way heap merge), so memory is bounded by two pages per device. Closing the generator (i.e. breaking out
+    of the loop) stops all outstanding requests.
+
+        for p in query_uplinks(api, '2017-03-01T10:00:00', '2017-03-01T10:15:00', tags=['x']):
+            ...
+
+    :param api       : API reference
+    :param start     : lower bound, unix seconds or ISO 8601 string
+    :param end       : upper bound (exclusive), unix seconds or ISO 8601 string, None for open end
+    :param tags      : select devices by tags (ignored if devices are given)
+    :param devices   : iterable of Devices to query
+    :param workers   : number of concurrent requests
+    :param chunksize : packets per request (1 to 100)
+    :return: generator providing UpPackets in time order
+    """
+    start = to_timestamp(start)
+    end = to_timestamp(end) if end is not None else None
+
+    if(devices is None):
+        devices = api.get_devices(tags=tags)
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    streams = []
+    try:
+        streams = [_DeviceStream(d, start, end, chunksize, pool) for d in devices if d is not None]
+
+        heap = []
+        for i, s in enumerate(streams):
+            head = s.next()
+            if(head is not None):
+                heap.append((head[0], i, head[1]))
+        heapq.heapify(heap)
+
+        while(heap):
+            ts, i, p = heap[0]
+            yield p
+            head = streams[i].next()
+            if(head is None):
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (head[0], i, head[1]))
+    finally:
+        for s in streams:
+            s.close()
+        pool.shutdown(wait=False)
@@ -0,0 +1,360 @@
+import hashlib
+import math
+from .util import to_timestamp
+
+
+class RunningStats(object):
+    """
+    One pass count/mean/variance/min/max (Welford), mergeable using Chan's parallel update
+    """
+    __slots__ = ['count', 'mean', 'm2', 'min', 'max']
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if(self.min is None or value < self.min):
+            self.min = value
+        if(self.max is None or value > self.max):
+            self.max = value
+
+    def merge(self, other):
+        if(not other.count):
+            return self
+
+        if(not self.count):
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        if(self.count < 2):
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def __getstate__(self):
+        return [getattr(self, k) for k in self.__slots__]
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+
+class QuantileSketch(object):
+    """
+    Fixed resolution histogram sketch. Memory is bounded by (hi - lo) / resolution buckets, values outside [lo, hi] are
+    clamped. Sketches of equal configuration can be merged by adding bucket counts.
+
+    :param lo         : lowest tracked value
+    :param hi         : highest tracked value
+    :param resolution : bucket width (quantile error is at most half of it)
+    """
+    __slots__ = ['lo', 'hi', 'resolution', 'count', 'buckets']
+
+    def __init__(self, lo, hi, resolution):
+        self.lo = lo
+        self.hi = hi
+        self.resolution = resolution
+        self.count = 0
+        self.buckets = {}
+
+    def add(self, value):
+        value = min(max(value, self.lo), self.hi)
+        b = int((value - self.lo) / self.resolution)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        if((self.lo, self.hi, self.resolution) != (other.lo, other.hi, other.resolution)):
+            raise ValueError('cannot merge sketches of different configuration')
+
+        for b, c in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + c
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """
+        :param q: quantile 0..1
+        :return: approximated value (bucket center) or None if empty
+        """
+        if(not self.count):
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if(seen > rank):
+                return self.lo + (b + 0.5) * self.resolution
+
+        return self.hi
+
+    def __getstate__(self):
+        return [getattr(self, k) for k in self.__slots__]
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+
+class DistinctCounter(object):
+    """
+    HyperLogLog distinct count estimator, uses 2^precision bytes of memory
+
+    :param precision: register index bits (4..16), standard error is about 1.04 / sqrt(2^precision)
+    """
+    __slots__ = ['precision', 'registers']
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        h = int(hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:16], 16)
+        idx = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 1
+        while(rank <= 64 - self.precision and not rest & 0x8000000000000000):
+            rank += 1
+            rest <<= 1
+
+        if(rank > self.registers[idx]):
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        if(self.precision != other.precision):
+            raise ValueError('cannot merge counters of different precision')
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+
+        # small range correction
+        if(raw <= 2.5 * m and zeros):
+            return int(round(m * math.log(float(m) / zeros)))
+
+        return int(round(raw))
+
+    def __getstate__(self):
+        return [self.precision, self.registers]
+
+    def __setstate__(self, state):
+        self.precision, self.registers = state
+
+
+class LinkAggregate(object):
+    """
+    Link quality aggregate of a single gateway or channel within one time bucket
+    """
+    __slots__ = ['rssi', 'lsnr', 'rssi_sketch', 'lsnr_sketch', 'devices']
+
+    def __init__(self, hll_precision=10):
+        self.rssi = RunningStats()
+        self.lsnr = RunningStats()
+        self.rssi_sketch = QuantileSketch(-160.0, 0.0, 1.0)
+        self.lsnr_sketch = QuantileSketch(-30.0, 20.0, 0.25)
+        self.devices = DistinctCounter(hll_precision)
+
+    @property
+    def count(self):
+        return max(self.rssi.count, self.lsnr.count)
+
+    def add(self, eui, rssi, lsnr):
+        if(rssi is not None):
+            self.rssi.add(rssi)
+            self.rssi_sketch.add(rssi)
+        if(lsnr is not None):
+            self.lsnr.add(lsnr)
+            self.lsnr_sketch.add(lsnr)
+        if(eui is not None):
+            self.devices.add(eui)
+
+    def merge(self, other):
+        self.rssi.merge(other.rssi)
+        self.lsnr.merge(other.lsnr)
+        self.rssi_sketch.merge(other.rssi_sketch)
+        self.lsnr_sketch.merge(other.lsnr_sketch)
+        self.devices.merge(other.devices)
+        return self
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        :param quantiles: quantiles to report
+        :return: plain dict of all statistics
+        """
+        return {
+            'count': self.count,
+            'devices': self.devices.estimate(),
+            'rssi': {
+                'mean': self.rssi.mean, 'stddev': self.rssi.stddev, 'min': self.rssi.min, 'max': self.rssi.max,
+                'quantiles': dict((q, self.rssi_sketch.quantile(q)) for q in quantiles)
+            },
+            'lsnr': {
+                'mean': self.lsnr.mean, 'stddev': self.lsnr.stddev, 'min': self.lsnr.min, 'max': self.lsnr.max,
+                'quantiles': dict((q, self.lsnr_sketch.quantile(q)) for q in quantiles)
+            }
+        }
+
+    def __getstate__(self):
+        return [getattr(self, k) for k in self.__slots__]
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+
+
+class LinkQualityAggregator(object):
+    """
+    Streaming per gateway and per channel (freq, spreading factor) link quality aggregation over up-packet iterators.
+    Every key holds a constant size aggregate, the number of retained time buckets can be bounded using max_buckets.
+    Aggregators (i.e. built by several workers) are picklable and can be merged.
+
+    :param bucket_seconds : time bucket width in seconds, 0 disables bucketing
+    :param max_buckets    : number of most recent time buckets to retain (None = unbounded)
+    :param hll_precision  : precision of the distinct device estimators
+    """
+
+    def __init__(self, bucket_seconds=3600, max_buckets=None, hll_precision=10):
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.hll_precision = hll_precision
+        self.packets = 0
+        self._gateways = {}
+        self._channels = {}
+        self._buckets = set()
+
+    def _bucket(self, received_at):
+        if(not self.bucket_seconds):
+            return 0
+        ts = to_timestamp(received_at)
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    def _aggregate(self, table, key):
+        agg = table.get(key)
+        if(agg is None):
+            agg = table[key] = LinkAggregate(self.hll_precision)
+        return agg
+
+    def add(self, packet):
+        """
+        Add a single up-packet
+        :param packet: UpPacket (None values, as yielded for empty pages, are ignored)
+        """
+        if(packet is None):
+            return
+
+        bucket = self._bucket(packet.received_at)
+        if(bucket not in self._buckets):
+            self._buckets.add(bucket)
+            self._evict()
+            if(bucket not in self._buckets):
+                # older than the retained window
+                return
+
+        eui = getattr(packet.device, 'eui', None)
+        channel = self._aggregate(self._channels, (packet.freq, packet.spreading_factor, bucket))
+        self.packets += 1
+
+        best_rssi = best_lsnr = None
+        for rx in packet.receptions():
+            rssi, lsnr = rx.get('rssi'), rx.get('lsnr')
+            if(rx.get('gweui')):
+                self._aggregate(self._gateways, (rx.get('gweui'), bucket)).add(eui, rssi, lsnr)
+            if(rssi is not None and (best_rssi is None or rssi > best_rssi)):
+                best_rssi = rssi
+            if(lsnr is not None and (best_lsnr is None or lsnr > best_lsnr)):
+                best_lsnr = lsnr
+
+        # the channel sees the best reception of every packet
+        channel.add(eui, best_rssi, best_lsnr)
+
+    def consume(self, packets):
+        """
+        Consume a packet iterator (i.e. as returned by Device.get_up_packets()[1] or Device.get_all_up_packets())
+        :param packets: iterable of UpPackets
+        :return: self
+        """
+        for p in packets:
+            self.add(p)
+        return self
+
+    def _evict(self):
+        if(not self.max_buckets or len(self._buckets) <= self.max_buckets):
+            return
+
+        keep = set(sorted(self._buckets)[-self.max_buckets:])
+        for table in (self._gateways, self._channels):
+            for key in [k for k in table if k[-1] not in keep]:
+                del table[key]
+        self._buckets = keep
+
+    def merge(self, other):
+        """
+        Merge another aggregator of the same configuration into this one
+        :param other: LinkQualityAggregator
+        :return: self
+        """
+        if(other.bucket_seconds != self.bucket_seconds):
+            raise ValueError('cannot merge aggregators of different bucket width')
+
+        for mine, theirs in ((self._gateways, other._gateways), (self._channels, other._channels)):
+            for key, agg in theirs.items():
+                self._aggregate(mine, key).merge(agg)
+
+        self.packets += other.packets
+        self._buckets |= other._buckets
+        self._evict()
+        return self
+
+    def _rollup(self, table, by_bucket):
+        if(by_bucket):
+            return table
+
+        ret = {}
+        for key, agg in table.items():
+            self._aggregate(ret, key[:-1]).merge(agg)
+        return ret
+
+    def gateways(self, by_bucket=True):
+        """
+        :param by_bucket: keep time buckets apart, otherwise aggregate over all retained buckets
+        :return: dict (gweui, bucket) -> LinkAggregate or gweui -> LinkAggregate
+        """
+        ret = self._rollup(self._gateways, by_bucket)
+        return ret if by_bucket else dict((k[0], v) for k, v in ret.items())
+
+    def channels(self, by_bucket=True):
+        """
+        :param by_bucket: keep time buckets apart, otherwise aggregate over all retained buckets
+        :return: dict (freq, spreading_factor, bucket) -> LinkAggregate or (freq, spreading_factor) -> LinkAggregate
+        """
+        return self._rollup(self._channels, by_bucket)
@@ -1,4 +1,5 @@
 from abc import ABCMeta
+import threading
 from .json_dump import JSONDump
 
 
@@ -148,44 +149,123 @@ class DictObserver(dict):
         return key, value
 
 
+def _copy(value):
+    # shallow copy of observed containers, so later in place changes are noticed
+    if(isinstance(value, list)):
+        return list(value)
+    if(isinstance(value, dict)):
+        return dict(value)
+    return value
+
+
 class Observable(JSONDump):
     """
     Observable type adapted from http://code.activestate.com/recipes/306864-list-and-dictionary-observer/
+
+    Change tracking state (_changed, _original_state) and the lock guarding it are held per instance, so observables
+    may be shared between threads. Use lock() to make compound changes atomic.
     """
     __metaclass__ = ABCMeta
 
-    _original_state = {}
-    _changed = []
+    _dirty = False
     _export = []
 
     def __init__(self):
-        self._dirty = False
+        self._state()
+
+    def _state(self):
+        d = self.__dict__
+        if('_lock' not in d):
+            d['_lock'] = threading.RLock()
+            d['_changed'] = []
+            d['_original_state'] = {}
+        return d
+
+    def lock(self):
+        """
+        :return: the (reentrant) lock guarding this instance's state
+        """
+        return self._state()['_lock']
 
     def __setattr__(self, key, value):
-        if key != '_dirty':
-            self._original_state[key] = getattr(self, key)
-            self._changed.append(key)
-            if(isinstance(value, list)):
-                self.__dict__[key] = ListObserver(value, self._Observer(self))
-            elif(isinstance(value, dict)):
-                self.__dict__[key] = DictObserver(value, self._Observer(self))
-            else:
-                self.__dict__[key] = value
-            self._make_dirty()
+        d = self._state()
+        if(key.startswith('_')):
+            d[key] = value
+            return
+
+        if(isinstance(value, list)):
+            value = ListObserver(value, self._Observer(self))
+        elif(isinstance(value, dict)):
+            value = DictObserver(value, self._Observer(self))
+
+        with d['_lock']:
+            if(key not in d['_original_state']):
+                d['_original_state'][key] = getattr(self, key, None)
+            if(key not in d['_changed']):
+                d['_changed'].append(key)
+            d[key] = value
+            d['_dirty'] = True
 
     def _make_dirty(self):
-        self._dirty = True
+        self._state()['_dirty'] = True
 
     def _not_dirty(self):
-        self._dirty = False
-        self._changed = []
+        d = self._state()
+        with d['_lock']:
+            d['_dirty'] = False
+            d['_changed'] = []
+            d['_original_state'] = {}
+
+    def _replace_state(self, values):
+        """
+        Atomically replace member values (i.e. after pulling from remote) and mark the instance clean
+        :param values: dict of new member values
+        """
+        d = self._state()
+        with d['_lock']:
+            d.update(values)
+            d['_dirty'] = False
+            d['_changed'] = []
+            d['_original_state'] = {}
+
+    def _merge_state(self, values):
+        """
+        Atomically update member values from remote, members with unsaved local changes keep their local value
+        :param values: dict of new member values
+        """
+        d = self._state()
+        with d['_lock']:
+            d.update((k, v) for k, v in values.items() if k not in d['_changed'])
+
+    def _snapshot_changes(self):
+        """
+        Values of the changed members (copied), taken with the request body before saving outside of the lock
+        :return: dict member -> value
+        """
+        d = self._state()
+        with d['_lock']:
+            return dict((k, _copy(d.get(k))) for k in d['_changed'])
+
+    def _mark_saved(self, snapshot):
+        """
+        Mark the members of a snapshot clean unless they were changed again meanwhile
+        :param snapshot: dict as returned by _snapshot_changes
+        """
+        d = self._state()
+        with d['_lock']:
+            for k, v in snapshot.items():
+                if(k in d['_changed'] and d.get(k) == v):
+                    d['_changed'].remove(k)
+                    d['_original_state'].pop(k, None)
+            if(not d['_changed']):
+                d['_dirty'] = False
 
     def get_changes(self):
-        return self._changed
+        return list(self._state()['_changed'])
 
     def export(self, changes_only=False):
         if(changes_only):
-            return self._changed.intersection(self.export(False))
+            return set(self.get_changes()).intersection(self.export(False))
 
         return self._export
 
@@ -49,6 +49,21 @@ class UpPacket(APIEntity):
         self._exists = True
         self.__dict__.update(args)
 
+    def receptions(self):
+        """
+        Gateway receptions of this packet, firefly delivers either a single gwrx dict or a list of them
+        :return: list of gwrx dicts
+        """
+        # the class level gwrx is a template only, packets without receptions don't have their own
+        gwrx = self.__dict__.get('gwrx')
+        if(not gwrx):
+            return []
+
+        if(isinstance(gwrx, dict)):
+            return [gwrx]
+
+        return list(gwrx)
+
 
 class DownPacket(APIEntity):
     """
@@ -72,7 +87,7 @@ class DownPacket(APIEntity):
     sent = False
     spreading_factor = 0
 
-    def __init__(self, device, args):
+    def __init__(self, device, **args):
         if ('device_eui' in args):
             args.pop('device_eui')
         self.device = device
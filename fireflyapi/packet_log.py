@@ -0,0 +1,335 @@
+import os
+import mmap
+import struct
+import bisect
+from .records import UpRecord, up_record_from_packet
+from .packet import UpPacket
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""
+Fixed size record layout (little endian):
+eui, received_at, fcnt, port, spreading_factor, freq, rssi, lsnr, payload offset, payload length
+"""
+RECORD = struct.Struct('<QdIHBxdffQI4x')
+RECORD_SIZE = RECORD.size
+
+"""
+Sidecar index entry: eui, received_at, record number
+"""
+INDEX_ENTRY = struct.Struct('<QdQ')
+
+if(np is not None):
+    RECORD_DTYPE = np.dtype({
+        'names': ['eui', 'received_at', 'fcnt', 'port', 'spreading_factor', 'freq', 'rssi', 'lsnr',
+                  'payload_offset', 'payload_length'],
+        'formats': ['<u8', '<f8', '<u4', '<u2', 'u1', '<f8', '<f4', '<f4', '<u8', '<u4'],
+        'offsets': [0, 8, 16, 20, 22, 24, 32, 36, 40, 48],
+        'itemsize': RECORD_SIZE
+    })
+    INDEX_DTYPE = np.dtype([('eui', '<u8'), ('received_at', '<f8'), ('recno', '<u8')])
+else:
+    RECORD_DTYPE = INDEX_DTYPE = None
+
+
+def _paths(path):
+    return path + '.rec', path + '.dat', path + '.idx'
+
+
+def _nan(v):
+    return float('nan') if v is None else v
+
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _truncate(path, size):
+    if(_size(path) > size):
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+
+def _read(f, struct_, n):
+    f.seek(n * struct_.size)
+    return struct_.unpack(f.read(struct_.size))
+
+
+def _recover(path):
+    """
+    Repair the tails of a log left by a crash while appending: torn records, payloads and index entries past the last
+    complete record are cut off, missing index entries are rebuilt from the records
+    :return: (record count, payload file size)
+    """
+    rec, dat, idx = _paths(path)
+    count = _size(rec) // RECORD_SIZE
+    dat_size = _size(dat)
+    offset = 0
+
+    if(count):
+        with open(rec, 'rb') as f:
+            # payloads are flushed first, but drop records whose payload did not make it to disk anyway
+            while(count):
+                fields = _read(f, RECORD, count - 1)
+                offset = fields[8] + fields[9]
+                if(offset <= dat_size):
+                    break
+                count -= 1
+                offset = 0
+    _truncate(rec, count * RECORD_SIZE)
+    _truncate(dat, offset)
+
+    # index entries are written in record order
+    entries = _size(idx) // INDEX_ENTRY.size
+    indexed = 0
+    if(entries):
+        with open(idx, 'rb') as f:
+            while(entries and _read(f, INDEX_ENTRY, entries - 1)[2] >= count):
+                entries -= 1
+            if(entries):
+                indexed = _read(f, INDEX_ENTRY, entries - 1)[2] + 1
+    _truncate(idx, entries * INDEX_ENTRY.size)
+
+    if(indexed < count):
+        with open(rec, 'rb') as f, open(idx, 'ab') as out:
+            for recno in range(indexed, count):
+                fields = _read(f, RECORD, recno)
+                out.write(INDEX_ENTRY.pack(fields[0], fields[1], recno))
+
+    return count, offset
+
+
+class PacketLogWriter(object):
+    """
+    Append only binary up-packet log. Consists of a fixed size record file (<path>.rec), a payload blob file
+    (<path>.dat) and a sidecar device/time index (<path>.idx). Opening an existing log repairs the tails left by a
+    crash while appending (see _recover), so new records stay aligned.
+
+        with PacketLogWriter('/var/lib/uplinks') as log:
+            log.extend(dev.get_all_up_packets())
+
+    :param path: base path of the log files
+    """
+
+    def __init__(self, path):
+        self.path = path
+        rec, dat, idx = _paths(path)
+        self._count, self._offset = _recover(path)
+        self._rec = open(rec, 'ab')
+        self._dat = open(dat, 'ab')
+        self._idx = open(idx, 'ab')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, packet):
+        """
+        Append a single packet
+        :param packet: UpPacket or UpRecord (None is ignored)
+        :return: record number or None
+        """
+        if(packet is None):
+            return None
+
+        if(isinstance(packet, UpPacket)):
+            packet = up_record_from_packet(packet)
+
+        eui = int(packet.eui, 16)
+        payload = packet.payload or b''
+        if(not isinstance(payload, bytes)):
+            payload = payload.encode('utf-8')
+
+        self._rec.write(RECORD.pack(
+            eui, packet.received_at, packet.fcnt or 0, packet.port or 0, packet.spreading_factor or 0,
+            packet.freq or 0, _nan(packet.rssi), _nan(packet.lsnr), self._offset, len(payload)
+        ))
+        self._dat.write(payload)
+        self._idx.write(INDEX_ENTRY.pack(eui, packet.received_at, self._count))
+
+        self._offset += len(payload)
+        self._count += 1
+        return self._count - 1
+
+    def extend(self, packets):
+        """
+        Append all packets of an iterator (i.e. a packet generator)
+        :param packets: iterable of UpPackets or UpRecords
+        :return: number of appended packets
+        """
+        n = 0
+        for p in packets:
+            if(self.append(p) is not None):
+                n += 1
+        return n
+
+    def flush(self):
+        # payloads and records first, so the index never references missing data
+        self._dat.flush()
+        self._rec.flush()
+        self._idx.flush()
+
+    def close(self):
+        if(self._rec is None):
+            return
+        self.flush()
+        for f in (self._dat, self._rec, self._idx):
+            f.close()
+        self._rec = self._dat = self._idx = None
+
+
+def _map(path):
+    f = open(path, 'rb')
+    try:
+        if(os.fstat(f.fileno()).st_size == 0):
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+
+class PacketLogReader(object):
+    """
+    mmap based reader for logs written by PacketLogWriter. Records are decoded on access only, as_numpy() exposes the
+    record file as a zero copy structured array.
+
+    :param path: base path of the log files
+    """
+
+    def __init__(self, path):
+        self.path = path
+        rec, dat, idx = _paths(path)
+        self._rec = _map(rec)
+        self._dat = _map(dat)
+        self._idx = _map(idx)
+        self._count = len(self._rec) // RECORD_SIZE if self._rec else 0
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for m in (self._rec, self._dat, self._idx):
+            if(m is not None):
+                m.close()
+        self._rec = self._dat = self._idx = None
+        self._index = None
+
+    def __len__(self):
+        return self._count
+
+    def payload(self, offset, length):
+        """
+        :return: zero copy memoryview of a payload
+        """
+        return memoryview(self._dat)[offset:offset + length]
+
+    def __getitem__(self, recno):
+        if(recno < 0):
+            recno += self._count
+        if(not 0 <= recno < self._count):
+            raise IndexError('record %s out of range' % recno)
+
+        eui, received_at, fcnt, port, sf, freq, rssi, lsnr, offset, length = \
+            RECORD.unpack_from(self._rec, recno * RECORD_SIZE)
+        return UpRecord(
+            '%016x' % eui, received_at, fcnt, port, freq, sf,
+            None if rssi != rssi else rssi, None if lsnr != lsnr else lsnr, None,
+            bytes(self._dat[offset:offset + length]).decode('utf-8'), None
+        )
+
+    def scan(self, start=0, stop=None):
+        """
+        Sequential scan in append order
+        :param start : first record number
+        :param stop  : end record number (exclusive)
+        :return: generator providing UpRecords
+        """
+        stop = self._count if stop is None else min(stop, self._count)
+        for i in range(start, stop):
+            yield self[i]
+
+    def as_numpy(self):
+        """
+        :return: zero copy numpy structured array (RECORD_DTYPE) view of all records, views must be released before
+                 closing the reader
+        """
+        if(np is None):
+            raise ImportError('numpy is required for as_numpy()')
+
+        if(not self._count):
+            return np.zeros(0, dtype=RECORD_DTYPE)
+
+        return np.frombuffer(self._rec, dtype=RECORD_DTYPE, count=self._count)
+
+    def _load_index(self):
+        if(self._index is not None):
+            return self._index
+
+        entries = len(self._idx) // INDEX_ENTRY.size if self._idx else 0
+        # ignore index entries of records not (yet) flushed
+        if(np is not None):
+            idx = np.frombuffer(self._idx, dtype=INDEX_DTYPE, count=entries) if entries else \
+                np.zeros(0, dtype=INDEX_DTYPE)
+            idx = idx[idx['recno'] < self._count]
+            idx = idx[np.lexsort((idx['received_at'], idx['eui']))]
+            self._index = (idx['eui'], idx['received_at'], idx['recno'])
+        else:
+            idx = sorted(e for e in (INDEX_ENTRY.unpack_from(self._idx, i * INDEX_ENTRY.size)
+                                     for i in range(entries)) if e[2] < self._count)
+            self._index = ([e[0] for e in idx], [e[1] for e in idx], [e[2] for e in idx])
+
+        return self._index
+
+    def range_recnos(self, eui, start=None, end=None):
+        """
+        Index lookup of a device's records within a time range
+        :param eui   : device eui
+        :param start : received_at lower bound (inclusive, unix seconds)
+        :param end   : received_at upper bound (exclusive, unix seconds)
+        :return: record numbers in time order (numpy array if numpy is available, else list)
+        """
+        euis, times, recnos = self._load_index()
+        key = int(eui, 16)
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+
+        if(np is not None):
+            lo = np.searchsorted(euis, key, 'left')
+            hi = np.searchsorted(euis, key, 'right')
+            t = times[lo:hi]
+            a = lo + np.searchsorted(t, start, 'left')
+            b = lo + np.searchsorted(t, end, 'left')
+            return recnos[a:b]
+
+        lo = bisect.bisect_left(euis, key)
+        hi = bisect.bisect_right(euis, key)
+        a = bisect.bisect_left(times, start, lo, hi)
+        b = bisect.bisect_left(times, end, lo, hi)
+        return recnos[a:b]
+
+    def range(self, eui, start=None, end=None):
+        """
+        Range query by device and time
+        :return: generator providing UpRecords in time order
+        """
+        for recno in self.range_recnos(eui, start, end):
+            yield self[int(recno)]
+
+    def range_numpy(self, eui, start=None, end=None):
+        """
+        Range query by device and time
+        :return: numpy structured array of the matching records (gathered, not a view)
+        """
+        return self.as_numpy()[self.range_recnos(eui, start, end)]
@@ -0,0 +1,232 @@
+"""
+Schema compiled downlink payload encoding. A schema (field names, types, byte order, bit fields) is compiled once into
+a packer, which encodes single values or whole batches (lists of rows or numpy columns) in one pass.
+
+    schema = PayloadSchema([('interval', 'u16'), ('mode', 'bits:4'), ('led', 'bits:1'), ('pad', 'bits:3'),
+                            ('threshold', 'f32')])
+    payloads = schema.encode_batch({'interval': intervals, 'mode': modes, 'led': 1, 'pad': 0, 'threshold': th},
+                                   encoding=PAYLOAD_ENCODING.BASE16)
+    for dev, payload in zip(devices, payloads):
+        dev.send_packet(payload, encoding=PAYLOAD_ENCODING.BASE16)
+"""
+import base64
+import struct
+import numbers
+import binascii
+from . import PAYLOAD_ENCODING
+from .api_exception import APIException
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_TYPES = {
+    'u8': ('B', 'u1', 0, 0xFF),
+    'i8': ('b', 'i1', -0x80, 0x7F),
+    'u16': ('H', 'u2', 0, 0xFFFF),
+    'i16': ('h', 'i2', -0x8000, 0x7FFF),
+    'u32': ('I', 'u4', 0, 0xFFFFFFFF),
+    'i32': ('i', 'i4', -0x80000000, 0x7FFFFFFF),
+    'u64': ('Q', 'u8', 0, 0xFFFFFFFFFFFFFFFF),
+    'i64': ('q', 'i8', -0x8000000000000000, 0x7FFFFFFFFFFFFFFF),
+    'f32': ('f', 'f4', None, None),
+    'f64': ('d', 'f8', None, None),
+}
+
+# unsigned container types for bit field groups by byte width
+_GROUP_TYPES = {1: 'u8', 2: 'u16', 4: 'u32', 8: 'u64'}
+
+
+class _BitGroup(object):
+    """
+    Consecutive bit fields packed msb first into one unsigned integer
+    """
+    def __init__(self):
+        self.fields = []  # (name, bits, shift)
+        self.bits = 0
+
+    def add(self, name, bits):
+        self.fields.append([name, bits, 0])
+        self.bits += bits
+
+    def close(self):
+        if(self.bits % 8 or self.bits // 8 not in _GROUP_TYPES):
+            raise APIException('bit fields must add up to 8, 16, 32 or 64 bits, got %s' % self.bits)
+        shift = self.bits
+        for f in self.fields:
+            shift -= f[1]
+            f[2] = shift
+        return _GROUP_TYPES[self.bits // 8]
+
+
+class PayloadSchema(object):
+    """
+    Compiled payload layout
+
+    :param fields    : list of (name, type) with type one of u8, i8, u16, i16, u32, i32, u64, i64, f32, f64 or
+                       'bits:<n>' for bit fields (consecutive bit fields are packed msb first and must fill whole
+                       bytes: 8, 16, 32 or 64 bits)
+    :param byteorder : 'big' (network order, default) or 'little'
+    """
+
+    def __init__(self, fields, byteorder='big'):
+        if(byteorder not in ('big', 'little')):
+            raise APIException('byteorder must be big or little')
+
+        self.fields = list(fields)
+        self.byteorder = byteorder
+        self.names = [f[0] for f in self.fields]
+
+        # slots: ('field', name, type) or ('bits', _BitGroup, container type)
+        self._slots = []
+        group = None
+        for name, ftype in self.fields:
+            if(ftype.startswith('bits:')):
+                if(group is None):
+                    group = _BitGroup()
+                group.add(name, int(ftype[5:]))
+                continue
+
+            if(ftype not in _TYPES):
+                raise APIException('unknown field type %s' % ftype)
+            if(group is not None):
+                self._slots.append(('bits', group, group.close()))
+                group = None
+            self._slots.append(('field', name, ftype))
+
+        if(group is not None):
+            self._slots.append(('bits', group, group.close()))
+
+        order = '>' if byteorder == 'big' else '<'
+        self._struct = struct.Struct(order + ''.join(_TYPES[s[2]][0] for s in self._slots))
+        self.size = self._struct.size
+
+        self._dtype = None
+        if(np is not None):
+            self._dtype = np.dtype([('f%d' % i, order + _TYPES[s[2]][1]) for i, s in enumerate(self._slots)])
+
+    def _slot_values(self, get):
+        ret = []
+        for kind, ref, ftype in self._slots:
+            if(kind == 'field'):
+                ret.append(get(ref))
+                continue
+
+            packed = 0
+            for name, bits, shift in ref.fields:
+                v = get(name)
+                if(not isinstance(v, numbers.Integral)):
+                    raise APIException('value %r of %s is not an integer' % (v, name))
+                if(not 0 <= v < (1 << bits)):
+                    raise APIException('value %s of %s does not fit into %s bits' % (v, name, bits))
+                packed |= v << shift
+            ret.append(packed)
+        return ret
+
+    def pack(self, values):
+        """
+        Encode a single record to raw bytes
+        :param values: dict by field name or sequence in field order
+        :return: bytes
+        """
+        if(isinstance(values, dict)):
+            get = values.__getitem__
+        else:
+            mapping = dict(zip(self.names, values))
+            get = mapping.__getitem__
+
+        try:
+            return self._struct.pack(*self._slot_values(get))
+        except struct.error as e:
+            raise APIException('payload not encodeable: %s' % e)
+
+    def encode(self, values, encoding=PAYLOAD_ENCODING.BASE16):
+        """
+        Encode a single record
+        :param values   : dict by field name or sequence in field order
+        :param encoding : PAYLOAD_ENCODING.BASE16/BASE64 or None for raw bytes
+        :return: encoded payload
+        """
+        return _encode_raw(self.pack(values), encoding)
+
+    def encode_batch(self, rows, encoding=PAYLOAD_ENCODING.BASE16):
+        """
+        Encode many records in one pass
+        :param rows     : dict of columns (sequences or numpy arrays, scalars are broadcast) or a list of records
+                          (dicts or sequences)
+        :param encoding : PAYLOAD_ENCODING.BASE16/BASE64 or None for raw bytes
+        :return: list of encoded payloads
+        """
+        if(isinstance(rows, dict)):
+            if(np is not None):
+                buf, n = self._pack_columns(rows)
+                return _split_encode(buf, n, self.size, encoding)
+            rows = _columns_to_rows(rows, self.names)
+
+        buf = b''.join(self.pack(r) for r in rows)
+        return _split_encode(buf, len(buf) // self.size if self.size else 0, self.size, encoding)
+
+    def _pack_columns(self, columns):
+        n = max([len(np.atleast_1d(v)) for v in columns.values()] or [0])
+        arr = np.zeros(n, dtype=self._dtype)
+
+        for i, (kind, ref, ftype) in enumerate(self._slots):
+            if(kind == 'field'):
+                col = np.broadcast_to(np.asarray(columns[ref]), (n,))
+                _check_range(ref, col, ftype)
+                arr['f%d' % i] = col
+                continue
+
+            packed = np.zeros(n, dtype=np.uint64)
+            for name, bits, shift in ref.fields:
+                col = np.broadcast_to(np.asarray(columns[name]), (n,))
+                _check_integral(name, col)
+                col = col.astype(np.int64)
+                if(np.any((col < 0) | (col >= (1 << bits)))):
+                    raise APIException('values of %s do not fit into %s bits' % (name, bits))
+                packed |= col.astype(np.uint64) << np.uint64(shift)
+            arr['f%d' % i] = packed
+
+        return arr.tobytes(), n
+
+
+def _check_integral(name, col):
+    # like struct.pack: no silent truncation of floats
+    if(col.dtype.kind not in 'iub'):
+        raise APIException('values of %s must be integers, got %s' % (name, col.dtype))
+
+
+def _check_range(name, col, ftype):
+    lo, hi = _TYPES[ftype][2], _TYPES[ftype][3]
+    if(lo is None):
+        return
+    _check_integral(name, col)
+    if(not len(col)):
+        return
+    if(col.min() < lo or col.max() > hi):
+        raise APIException('values of %s out of range for %s' % (name, ftype))
+
+
+def _columns_to_rows(columns, names):
+    n = max([len(v) for v in columns.values() if isinstance(v, (list, tuple))] or [1])
+    cols = dict((k, v if isinstance(v, (list, tuple)) else [v] * n) for k, v in columns.items())
+    return [dict((k, cols[k][i]) for k in names) for i in range(n)]
+
+
+def _encode_raw(raw, encoding):
+    if(not encoding):
+        return raw
+    if(encoding == PAYLOAD_ENCODING.BASE16):
+        return binascii.hexlify(raw).decode('ascii')
+    if(encoding == PAYLOAD_ENCODING.BASE64):
+        return base64.b64encode(raw).decode('ascii')
+    raise APIException('payload encoding %s not supported for binary payloads' % encoding)
+
+
+def _split_encode(buf, n, size, encoding):
+    if(encoding == PAYLOAD_ENCODING.BASE16):
+        # hexlify the whole batch at once and slice
+        hexed = binascii.hexlify(buf).decode('ascii')
+        return [hexed[i * 2 * size:(i + 1) * 2 * size] for i in range(n)]
+    return [_encode_raw(buf[i * size:(i + 1) * size], encoding) for i in range(n)]
@@ -0,0 +1,153 @@
+import threading
+import multiprocessing
+try:
+    import ujson as json
+except ImportError:
+    import json
+from .records import up_record
+
+
+_decoder = None
+
+
+def _init_worker(decoder):
+    global _decoder
+    _decoder = decoder
+
+
+def _decode_page(task):
+    """
+    Worker side: parse a raw page body and convert it to UpRecords
+    :param task: tuple (eui, raw page body)
+    :return: list of UpRecords
+    """
+    eui, body = task
+    if(isinstance(body, bytes)):
+        body = body.decode('utf-8')
+
+    ret = []
+    for p in json.loads(body).get('packets') or []:
+        rec = up_record(p, eui)
+        if(_decoder):
+            rec = rec._replace(parsed=_decoder(rec))
+        ret.append(rec)
+    return ret
+
+
+class PagePipeline(object):
+    """
+    Decodes raw packet pages (see Device.get_up_packet_pages) into UpRecords using a process pool, so json parsing and
+    payload decoding scale with the number of cores while pages are still being fetched.
+
+        with PagePipeline() as pl:
+            for rec in pl.backfill(api.get_devices()):
+                ...
+
+    :param processes   : number of worker processes (defaults to cpu count)
+    :param batch_pages : number of pages shipped to a worker at once
+    :param ordered     : preserve input page order
+    :param max_pending : maximum number of pages fetched but not yet consumed (bounds memory)
+    :param decoder     : optional picklable (module level) callable, called in the workers for every UpRecord, its
+                         result is stored in the records parsed field
+    """
+
+    def __init__(self, processes=None, batch_pages=8, ordered=True, max_pending=256, decoder=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_pages = batch_pages
+        self.ordered = ordered
+        self.max_pending = max(max_pending, batch_pages)
+        self.decoder = decoder
+        self._pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if(exc_type):
+            self.terminate()
+        else:
+            self.close()
+
+    def start(self):
+        if(self._pool is None):
+            self._pool = multiprocessing.Pool(self.processes, _init_worker, (self.decoder,))
+        return self
+
+    def close(self):
+        if(self._pool is not None):
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        if(self._pool is not None):
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def map_pages(self, pages):
+        """
+        Decode raw pages
+        :param pages: iterable of tuples (eui, raw page body)
+        :return: generator providing one list of UpRecords per page
+        """
+        self.start()
+        pending = threading.BoundedSemaphore(self.max_pending)
+        stop = threading.Event()
+
+        # the pool consumes the input from its task handler thread, throttle it to max_pending pages
+        def _throttled():
+            for page in pages:
+                pending.acquire()
+                if(stop.is_set()):
+                    return
+                yield page
+
+        if(self.ordered):
+            results = self._pool.imap(_decode_page, _throttled(), self.batch_pages)
+        else:
+            results = self._pool.imap_unordered(_decode_page, _throttled(), self.batch_pages)
+
+        try:
+            for records in results:
+                pending.release()
+                yield records
+        finally:
+            # consumer stopped early: end the input so the task handler (and close()) don't block forever
+            stop.set()
+            try:
+                pending.release()
+            except ValueError:
+                pass
+
+    def map(self, pages):
+        """
+        Decode raw pages
+        :param pages: iterable of tuples (eui, raw page body)
+        :return: generator providing UpRecords
+        """
+        pages = self.map_pages(pages)
+        try:
+            for records in pages:
+                for rec in records:
+                    yield rec
+        finally:
+            pages.close()
+
+    def backfill(self, devices, chunksize=100, received_after=0):
+        """
+        Fetch and decode the up-packet history of all given devices
+        :param devices        : iterable of Devices (None entries are skipped)
+        :param chunksize      : packets per requested page
+        :param received_after : only packets received after a specific date
+        :return: generator providing UpRecords
+        """
+        def _pages():
+            for dev in devices:
+                if(dev is None):
+                    continue
+                for body in dev.get_up_packet_pages(chunksize=chunksize, received_after=received_after):
+                    yield dev.eui, body
+
+        return self.map(_pages())
@@ -0,0 +1,88 @@
+"""
+Read-ahead for paged generators: the source is consumed by a background thread into a bounded buffer, so fetching the
+next page overlaps with processing the current one.
+
+    for p in prefetch(dev.get_all_up_packets(chunksize=100), buffer=200):
+        ...
+    for page in prefetch(dev.get_up_packet_pages(), buffer=4):
+        ...
+"""
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+_DONE = object()
+
+# seconds between checks whether the consumer went away while the buffer is full
+_POLL = 0.1
+
+
+class _Error(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def _produce(iterable, buf, stop):
+    it = None
+    try:
+        it = iter(iterable)
+        for item in it:
+            while(True):
+                if(stop.is_set()):
+                    return
+                try:
+                    buf.put(item, timeout=_POLL)
+                    break
+                except queue.Full:
+                    pass
+        item = _DONE
+    except BaseException as e:
+        item = _Error(e)
+    finally:
+        if(stop.is_set() and it is not None and hasattr(it, 'close')):
+            it.close()
+
+    while(not stop.is_set()):
+        try:
+            buf.put(item, timeout=_POLL)
+            return
+        except queue.Full:
+            pass
+
+
+def prefetch(iterable, buffer=100):
+    """
+    Iterate over iterable while a background thread reads ahead up to buffer items (i.e. Devices, packets or pages of
+    Device.get_up_packet_pages), errors raised by the source are re-raised to the consumer at the position they
+    occurred. Closing the returned generator (or leaving the loop) stops the read ahead after the current item.
+    Note that thread local settings (i.e. API.priority()) do not apply to the requests made by the background thread.
+    :param iterable : source iterable or generator
+    :param buffer   : maximum number of items read ahead (bounds memory)
+    :return: generator providing the items of iterable
+    """
+    buf = queue.Queue(max(buffer, 1))
+    stop = threading.Event()
+    worker = threading.Thread(target=_produce, args=(iterable, buf, stop), name='fireflyapi-prefetch')
+    worker.daemon = True
+    worker.start()
+
+    try:
+        while(True):
+            item = buf.get()
+            if(item is _DONE):
+                return
+            if(isinstance(item, _Error)):
+                # py3 keeps the producer side traceback on the exception
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting for space
+        try:
+            while(True):
+                buf.get_nowait()
+        except queue.Empty:
+            pass
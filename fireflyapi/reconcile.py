@@ -0,0 +1,231 @@
+import csv
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import ujson as json
+except ImportError:
+    import json
+from . import logger
+from .device import Device
+from .util import is_string
+
+
+"""
+Fields compared between desired and remote state
+"""
+RECONCILED_FIELDS = sorted(set(Device._export) | {'application'})
+
+_HEX_FIELDS = {'eui', 'address', 'network_session_key', 'application_session_key', 'application_key'}
+_BOOL_FIELDS = {'otaa', 'class_c'}
+
+"""
+Single reconciliation step, action is one of 'create', 'update', 'delete'. changes holds the fields to set.
+"""
+ReconcileOp = namedtuple('ReconcileOp', ['action', 'eui', 'device', 'changes'])
+
+"""
+Result of applying a plan, errors is a list of (ReconcileOp, exception)
+"""
+ReconcileResult = namedtuple('ReconcileResult', ['created', 'updated', 'deleted', 'errors'])
+
+
+def _normalize(field, value):
+    if(value is None or value == ''):
+        return None
+    if(field in _HEX_FIELDS):
+        return str(value).lower()
+    if(field in _BOOL_FIELDS):
+        if(is_string(value)):
+            return value.strip().lower() in ('1', 'true', 'yes', 'y')
+        return bool(value)
+    if(field == 'tags'):
+        if(is_string(value)):
+            value = value.split(',')
+        return sorted(t.strip() for t in value if t and t.strip()) or None
+    if(field == 'application'):
+        return int(value)
+    return value
+
+
+def normalize_record(record):
+    """
+    Normalize a desired state record (hex in lower case, tags as sorted list, booleans and ids parsed)
+    :param record: dict, unknown fields are dropped
+    :return: normalized dict
+    """
+    return dict((k, _normalize(k, record[k])) for k in RECONCILED_FIELDS if k in record)
+
+
+def content_hash(values, fields=RECONCILED_FIELDS):
+    """
+    Content hash over normalized field values
+    :param values : normalized dict (missing fields hash as None)
+    :param fields : fields to include
+    :return: hex digest
+    """
+    payload = json.dumps([[k, values.get(k)] for k in fields])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def device_values(device, fields=RECONCILED_FIELDS):
+    """
+    :return: normalized field values of a Device
+    """
+    return dict((k, _normalize(k, getattr(device, k, None))) for k in fields)
+
+
+def load_desired_state(path):
+    """
+    Load a desired state file, either a json list of device dicts, newline delimited json or csv with a header line
+    (tags comma separated within the cell)
+    :param path: file path
+    :return: list of normalized device dicts
+    """
+    with open(path) as f:
+        if(path.endswith('.csv')):
+            return [normalize_record(r) for r in csv.DictReader(f)]
+
+        data = f.read()
+        if(data.lstrip().startswith('[')):
+            return [normalize_record(r) for r in json.loads(data)]
+
+        return [normalize_record(json.loads(l)) for l in data.splitlines() if l.strip()]
+
+
+class ReconcilePlan(object):
+    """
+    Minimal set of operations turning the remote fleet into the desired state
+    """
+
+    def __init__(self, ops, unchanged):
+        self.ops = ops
+        self.unchanged = unchanged
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    @property
+    def is_noop(self):
+        return not self.ops
+
+    def summary(self):
+        ret = {'create': 0, 'update': 0, 'delete': 0, 'unchanged': self.unchanged}
+        for op in self.ops:
+            ret[op.action] += 1
+        return ret
+
+
+class FleetReconciler(object):
+    """
+    Declarative fleet reconciliation. Pulls the remote fleet with a single listing, compares it to the desired state by
+    content hash and applies the resulting create/update/delete plan concurrently.
+
+        rec = FleetReconciler(api)
+        plan = rec.plan(load_desired_state('fleet.json'))
+        rec.apply(plan, progress=lambda done, total, op, err: ...)
+
+    :param api   : API reference
+    :param tags  : restrict the remote fleet to devices with these tags
+    :param prune : delete remote devices missing in the desired state
+    """
+
+    def __init__(self, api, tags=None, prune=False):
+        self.api = api
+        self.tags = tags
+        self.prune = prune
+
+    def remote_state(self):
+        """
+        :return: dict eui -> Device of the remote fleet
+        """
+        return dict((d.eui.lower(), d) for d in self.api.get_devices(tags=self.tags) if d is not None)
+
+    def plan(self, desired, remote=None):
+        """
+        Build the reconciliation plan, no requests besides the device listing are made
+        :param desired : iterable of device dicts (see load_desired_state)
+        :param remote  : dict eui -> Device, fetched if not given
+        :return: ReconcilePlan
+        """
+        if(remote is None):
+            remote = self.remote_state()
+
+        ops = []
+        seen = set()
+        unchanged = 0
+        for rec in desired:
+            rec = normalize_record(rec)
+            eui = rec.get('eui')
+            if(not eui):
+                raise ValueError('desired device without eui: %s' % rec)
+            if(eui in seen):
+                raise ValueError('duplicate eui in desired state: %s' % eui)
+            seen.add(eui)
+
+            dev = remote.get(eui)
+            if(dev is None):
+                ops.append(ReconcileOp('create', eui, None, rec))
+                continue
+
+            # only fields given in the desired state are reconciled
+            fields = sorted(rec)
+            current = device_values(dev, fields)
+            if(content_hash(rec, fields) == content_hash(current, fields)):
+                unchanged += 1
+                continue
+
+            changes = dict((k, v) for k, v in rec.items() if current.get(k) != v)
+            ops.append(ReconcileOp('update', eui, dev, changes))
+
+        if(self.prune):
+            for eui in sorted(set(remote) - seen):
+                ops.append(ReconcileOp('delete', eui, remote[eui], None))
+
+        return ReconcilePlan(ops, unchanged)
+
+    def _apply_op(self, op):
+        if(op.action == 'create'):
+            Device(self.api, **op.changes).create()
+        elif(op.action == 'update'):
+            with op.device.lock():
+                for k, v in op.changes.items():
+                    setattr(op.device, k, v)
+                op.device.update()
+        elif(op.action == 'delete'):
+            op.device.delete()
+
+    def apply(self, plan, workers=8, progress=None):
+        """
+        Execute a plan concurrently, failing operations don't stop the others
+        :param plan     : ReconcilePlan
+        :param workers  : number of concurrent requests
+        :param progress : callable(done, total, op, exception or None) invoked after every operation
+        :return: ReconcileResult
+        """
+        counts = {'create': 0, 'update': 0, 'delete': 0}
+        errors = []
+        total = len(plan)
+        done = 0
+
+        if(plan.is_noop):
+            return ReconcileResult(0, 0, 0, errors)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = dict((pool.submit(self._apply_op, op), op) for op in plan)
+            for fut in as_completed(futures):
+                op = futures[fut]
+                err = fut.exception()
+                done += 1
+                if(err is None):
+                    counts[op.action] += 1
+                else:
+                    logger.warn('%s of device %s failed: %s' % (op.action, op.eui, err))
+                    errors.append((op, err))
+                if(progress):
+                    progress(done, total, op, err)
+
+        return ReconcileResult(counts['create'], counts['update'], counts['delete'], errors)
@@ -0,0 +1,66 @@
+from collections import namedtuple
+from .util import to_timestamp
+
+
+"""
+Compact flat representation of an up-packet. received_at is unix seconds, rssi/lsnr/gweui are taken from the best
+(highest snr) gateway reception.
+"""
+UpRecord = namedtuple('UpRecord', [
+    'eui', 'received_at', 'fcnt', 'port', 'freq', 'spreading_factor', 'rssi', 'lsnr', 'gweui', 'payload', 'parsed'
+])
+
+
+def _best_reception(gwrx):
+    if(not gwrx):
+        return {}
+
+    if(isinstance(gwrx, dict)):
+        return gwrx
+
+    return max(gwrx, key=lambda rx: rx.get('lsnr') if rx.get('lsnr') is not None else float('-inf'))
+
+
+def up_record(data, eui=None):
+    """
+    Build an UpRecord from a raw packet dict (as contained in the packets list of a page)
+    :param data : packet dict
+    :param eui  : device eui, defaults to the packets device_eui
+    :return: UpRecord
+    """
+    rx = _best_reception(data.get('gwrx'))
+    return UpRecord(
+        eui or data.get('device_eui'),
+        to_timestamp(data.get('received_at')),
+        data.get('fcnt', 0),
+        data.get('port', 0),
+        data.get('freq', 0),
+        data.get('spreading_factor', 0),
+        rx.get('rssi'),
+        rx.get('lsnr'),
+        rx.get('gweui'),
+        data.get('payload'),
+        data.get('parsed')
+    )
+
+
+def up_record_from_packet(packet):
+    """
+    Build an UpRecord from an UpPacket
+    :param packet: UpPacket
+    :return: UpRecord
+    """
+    rx = _best_reception(packet.receptions())
+    return UpRecord(
+        getattr(packet.device, 'eui', None),
+        to_timestamp(packet.received_at),
+        packet.fcnt,
+        packet.port,
+        packet.freq,
+        packet.spreading_factor,
+        rx.get('rssi'),
+        rx.get('lsnr'),
+        rx.get('gweui'),
+        packet.payload,
+        packet.parsed
+    )
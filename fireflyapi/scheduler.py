@@ -0,0 +1,118 @@
+"""
+Priority aware request scheduling: requests of the priority classes interactive, normal and bulk share one
+concurrency and rate budget by weighted fair queueing, requests close to their deadline are dispatched first.
+Used by API if max_concurrency or rate_limit is set.
+"""
+import time
+import heapq
+import itertools
+import threading
+from . import PRIORITY
+from .api_exception import DeadlineExceededError
+
+
+"""
+Default share of the request budget per priority class
+"""
+DEFAULT_WEIGHTS = {PRIORITY.INTERACTIVE: 16, PRIORITY.NORMAL: 4, PRIORITY.BULK: 1}
+
+
+class RequestScheduler(object):
+    """
+    Dispatches waiting requests when a concurrency slot and a rate token are available. Busy classes get slots in
+    proportion to their weights, a class that was idle does not build up credit. Requests due within urgency seconds
+    of their deadline skip the fair share (earliest deadline first), requests not dispatched before their deadline
+    raise DeadlineExceededError.
+
+    :param concurrency  : maximum number of requests in flight, None for no limit
+    :param rate_limiter : util.RateLimiter shared by all classes, None for no limit
+    :param weights      : dict priority -> weight, defaults to DEFAULT_WEIGHTS
+    :param urgency      : seconds before a deadline a request is considered urgent
+    """
+
+    def __init__(self, concurrency=None, rate_limiter=None, weights=None, urgency=0.1):
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or {})
+        self.urgency = urgency
+
+        self._cond = threading.Condition(threading.Lock())
+        self._queues = dict((p, []) for p in self.weights)
+        self._vtime = dict((p, 0.0) for p in self.weights)
+        self._seq = itertools.count()
+        self._active = 0
+        self.stats = dict((p, {'dispatched': 0, 'expired': 0, 'wait': 0.0}) for p in self.weights)
+
+    def _pick(self, now):
+        # earliest deadline first among urgent requests, weighted fair share otherwise
+        urgent = None
+        for q in self._queues.values():
+            if(q and q[0][0] - now <= self.urgency and (urgent is None or q[0] < urgent)):
+                urgent = q[0]
+        if(urgent is not None):
+            return urgent
+
+        busy = [p for p, q in self._queues.items() if q]
+        if(not busy):
+            return None
+        p = min(busy, key=lambda p: (self._vtime[p], p))
+        # within a class: requests with deadlines first, fifo otherwise
+        return self._queues[p][0]
+
+    def acquire(self, priority=PRIORITY.NORMAL, deadline=None):
+        """
+        Wait for dispatch
+        :param priority : PRIORITY class
+        :param deadline : absolute time (time.time()) the request has to be dispatched by, None for no deadline
+        """
+        if(priority not in self._queues):
+            priority = PRIORITY.NORMAL
+
+        queued = time.time()
+        ticket = [deadline if deadline is not None else float('inf'), next(self._seq), priority]
+
+        with self._cond:
+            q = self._queues[priority]
+            if(not q):
+                # an idle class rejoins at the current virtual time, no credit for idling
+                busy = [self._vtime[p] for p, other in self._queues.items() if other]
+                if(busy):
+                    self._vtime[priority] = max(self._vtime[priority], min(busy))
+            heapq.heappush(q, ticket)
+
+            try:
+                while(True):
+                    now = time.time()
+                    if(ticket[0] <= now):
+                        self.stats[priority]['expired'] += 1
+                        raise DeadlineExceededError('request not dispatched within its deadline')
+
+                    timeout = None if ticket[0] == float('inf') else ticket[0] - now
+                    if(self._pick(now) is ticket and (self.concurrency is None or self._active < self.concurrency)):
+                        wait = self.rate_limiter.try_acquire() if self.rate_limiter is not None else 0
+                        if(not wait):
+                            break
+                        timeout = wait if timeout is None else min(timeout, wait)
+                    elif(timeout is not None and timeout > self.urgency):
+                        # wake up when the request gets urgent
+                        timeout -= self.urgency
+
+                    self._cond.wait(timeout)
+            finally:
+                q.remove(ticket)
+                heapq.heapify(q)
+                self._cond.notify_all()
+
+            self._active += 1
+            self._vtime[priority] += 1.0 / self.weights[priority]
+            self.stats[priority]['dispatched'] += 1
+            self.stats[priority]['wait'] += time.time() - queued
+
+    def release(self):
+        """
+        Request finished, free its slot
+        """
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
@@ -0,0 +1,254 @@
+"""
+asyncio (Python 3.5+) HTTP sink receiving packets pushed by firefly (see Application.sink). Minimal HTTP/1.1 server
+with keep-alive, pushed uplinks are parsed into UpRecords (or UpPackets) and handed to consumers through a bounded
+queue. A full queue stops reading from the connections (backpressure) unless reject is set.
+
+    server = SinkServer(port=8080, secret='s3cret')     # sink url: http://host:8080/?token=s3cret
+    await server.start()
+    while(True):
+        batch = await server.get_batch(max_size=500, max_wait=0.1)
+        ...
+"""
+import asyncio
+try:
+    import ujson as json
+except ImportError:
+    import json
+from . import logger
+from .records import up_record
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status):
+        self.status = status
+        super(_HTTPError, self).__init__(_REASONS.get(status, ''))
+
+
+def packets_from_body(body):
+    """
+    Extract the pushed packets from a decoded request body: a single packet, a list of packets or a dict holding
+    them in packets/packet (the device eui is taken from device_eui or a device dict next to or within the packet)
+    :param body: decoded json
+    :return: list of (eui, packet dict)
+    """
+    if(isinstance(body, list)):
+        items, outer = body, {}
+    elif('packets' in body):
+        items, outer = body['packets'] or [], body
+    elif('packet' in body):
+        items, outer = [body['packet']], body
+    else:
+        items, outer = [body], {}
+
+    ret = []
+    for p in items:
+        eui = p.get('device_eui') or outer.get('device_eui')
+        if(not eui):
+            dev = p.get('device') or outer.get('device') or {}
+            eui = dev.get('eui') if isinstance(dev, dict) else None
+        ret.append((eui.lower() if eui else None, p))
+    return ret
+
+
+class SinkServer(object):
+    """
+    HTTP sink server
+
+    :param host       : address to listen on
+    :param port       : port to listen on (0 picks a free one, see port after start())
+    :param path       : request path packets are accepted on
+    :param secret     : if set, requests have to carry it as token query parameter
+    :param queue_size : maximum number of queued packets
+    :param packets    : deliver UpPackets instead of UpRecords (devices are resolved through api if given)
+    :param api        : API used to resolve devices for UpPackets
+    :param reject     : answer 503 if the queue is full instead of waiting for the consumers
+    :param max_body   : maximum request body size in bytes
+    """
+
+    def __init__(self, host='0.0.0.0', port=8080, path='/', secret=None, queue_size=10000, packets=False, api=None,
+                 reject=False, max_body=1 << 20):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.queue_size = queue_size
+        self.packets = packets
+        self.api = api
+        self.reject = reject
+        self.max_body = max_body
+        self.queue = None
+        self.stats = {'requests': 0, 'packets': 0, 'rejected': 0, 'errors': 0, 'connections': 0}
+        self._server = None
+
+    async def start(self):
+        """
+        Start listening
+        """
+        self.queue = asyncio.Queue(self.queue_size)
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info('sink listening on %s:%s%s' % (self.host, self.port, self.path))
+
+    async def stop(self):
+        """
+        Stop listening (queued packets stay available)
+        """
+        if(self._server is not None):
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def get(self):
+        """
+        :return: next received packet
+        """
+        return await self.queue.get()
+
+    async def get_batch(self, max_size=100, max_wait=0.05):
+        """
+        Micro batch: waits for the first packet, then collects until max_size packets or max_wait seconds
+        :return: list of packets
+        """
+        loop = asyncio.get_event_loop()
+        batch = [await self.queue.get()]
+        end = loop.time() + max_wait
+        while(len(batch) < max_size):
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = end - loop.time()
+            if(timeout <= 0):
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _convert(self, eui, data):
+        if(not self.packets):
+            return up_record(data, eui)
+
+        from .packet import UpPacket
+        from .device import Device
+        if(self.api is not None):
+            device = self.api._resolve_device({'eui': eui})
+        else:
+            device = Device(None, eui=eui, _exists=True)
+        return UpPacket(device, **data)
+
+    async def _deliver(self, body):
+        try:
+            items = packets_from_body(json.loads(body.decode('utf-8')))
+        except (ValueError, TypeError, AttributeError):
+            raise _HTTPError(400)
+
+        try:
+            converted = [self._convert(eui, p) for eui, p in items]
+        except Exception as e:
+            # i.e. unparseable received_at, answered so the pusher does not retry the same malformed packet
+            logger.warning('sink: malformed packet: %s' % e)
+            raise _HTTPError(400)
+        if(self.reject and self.queue.maxsize and self.queue.qsize() + len(converted) > self.queue.maxsize):
+            self.stats['rejected'] += len(converted)
+            raise _HTTPError(503)
+
+        for c in converted:
+            try:
+                self.queue.put_nowait(c)
+            except asyncio.QueueFull:
+                # backpressure: the connection is not read until consumers catch up
+                await self.queue.put(c)
+        self.stats['packets'] += len(converted)
+
+    async def _read_body(self, reader, headers):
+        if('chunked' in headers.get('transfer-encoding', '').lower()):
+            chunks = []
+            size = 0
+            while(True):
+                n = int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16)
+                if(n == 0):
+                    # skip trailers
+                    while((await reader.readline()) not in (b'\r\n', b'\n', b'')):
+                        pass
+                    return b''.join(chunks)
+                size += n
+                if(size > self.max_body):
+                    raise _HTTPError(413)
+                chunks.append(await reader.readexactly(n))
+                await reader.readexactly(2)
+
+        if('content-length' not in headers):
+            raise _HTTPError(411)
+        length = int(headers['content-length'])
+        if(length > self.max_body):
+            raise _HTTPError(413)
+        return await reader.readexactly(length)
+
+    async def _serve(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while(True):
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, False)
+                    return
+                headers = {}
+                for l in lines[1:]:
+                    if(':' in l):
+                        k, v = l.split(':', 1)
+                        headers[k.strip().lower()] = v.strip()
+
+                conn = headers.get('connection', '').lower()
+                keep_alive = conn != 'close' if version == 'HTTP/1.1' else conn == 'keep-alive'
+
+                self.stats['requests'] += 1
+                status = 200
+                try:
+                    body = await self._read_body(reader, headers) if method in ('POST', 'PUT') else b''
+                    path, _, query = target.partition('?')
+                    if(path != self.path):
+                        raise _HTTPError(404)
+                    if(method not in ('POST', 'PUT')):
+                        raise _HTTPError(405)
+                    if(self.secret and ('token=%s' % self.secret) not in query.split('&')):
+                        raise _HTTPError(403)
+                    await self._deliver(body)
+                except _HTTPError as e:
+                    status = e.status
+                    self.stats['errors'] += 1
+                    # the rest of an oversized or unframed body can't be skipped
+                    keep_alive = keep_alive and status not in (411, 413)
+                except (asyncio.IncompleteReadError, ValueError):
+                    # connection closed or broken framing (i.e. invalid chunk size), nothing to answer
+                    return
+                except Exception as e:
+                    logger.error('sink: request failed: %s' % e)
+                    status = 500
+                    self.stats['errors'] += 1
+                    keep_alive = False
+
+                await self._respond(writer, status, keep_alive)
+                if(not keep_alive):
+                    return
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, keep_alive):
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: %s\r\n\r\n' % (
+            status, _REASONS.get(status, ''), 'keep-alive' if keep_alive else 'close')).encode('latin-1'))
+        await writer.drain()
@@ -1,5 +1,10 @@
 from . import string_types
+import time
 import types
+import threading
+import calendar
+import numbers
+from datetime import datetime
 
 
 def _enum(*sequential, **named):
@@ -20,6 +25,95 @@ def _enum(*sequential, **named):
 def is_string(s):
     return isinstance(s, string_types)
 
+def to_timestamp(value):
+    """
+    Convert an API timestamp (unix seconds or ISO 8601 string as delivered by firefly) to unix seconds (UTC)
+    :param value: timestamp value, None and empty strings map to 0
+    :return: seconds since epoch as float
+    """
+    if(not value):
+        return 0.0
+
+    if(isinstance(value, numbers.Number)):
+        return float(value)
+
+    value = value.strip()
+    if(value.endswith('Z')):
+        value = value[:-1]
+    elif(len(value) > 19 and value[-6] in '+-' and value[-3] == ':'):
+        # utc offsets are not expected from firefly, drop them
+        value = value[:-6]
+
+    fraction = 0.0
+    if('.' in value):
+        value, frac = value.split('.', 1)
+        fraction = float('0.%s' % frac)
+
+    dt = datetime.strptime(value.replace(' ', 'T'), '%Y-%m-%dT%H:%M:%S')
+    return calendar.timegm(dt.timetuple()) + fraction
+
+def to_iso(value):
+    """
+    Format a timestamp for API queries (i.e. received_after)
+    :param value: unix seconds (UTC) or an already formatted string
+    :return: ISO 8601 string
+    """
+    if(is_string(value)):
+        return value
+    return datetime.utcfromtimestamp(value).strftime('%Y-%m-%dT%H:%M:%S')
+
+class RateLimiter(object):
+    """
+    Thread safe token bucket
+
+    :param rate  : tokens (requests) per second
+    :param burst : bucket size, defaults to one second worth of tokens
+    """
+
+    def __init__(self, rate, burst=None):
+        if(rate <= 0):
+            raise ValueError('rate must be positive')
+        self._lock = threading.Lock()
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.time()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate, burst=None):
+        """
+        Change the rate (i.e. on rebalancing), tokens already in the bucket are kept
+        """
+        with self._lock:
+            self._refill(time.time())
+            self.rate = float(rate)
+            self.burst = float(burst if burst else max(rate, 1))
+            self._tokens = min(self._tokens, self.burst)
+
+    def try_acquire(self, tokens=1):
+        """
+        :return: 0 if the tokens were taken, otherwise the seconds to wait until they are available
+        """
+        with self._lock:
+            self._refill(time.time())
+            if(self._tokens >= tokens):
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """
+        Block until tokens are available and take them
+        """
+        while(True):
+            wait = self.try_acquire(tokens)
+            if(not wait):
+                return
+            time.sleep(wait)
+
 """
 HTTP 'verbs' enum
 """
@@ -29,3 +123,8 @@ HTTP_VERBS = _enum(GET=0, POST=1, PUT=2, DELETE=3, PATCH=4)
 PAYLOAD_ENCODING
 """
 PAYLOAD_ENCODING = _enum(BASE16='base16', BASE64='base64', UTF_8='utf8')
+
+"""
+Request priority classes (see API.call and scheduler.RequestScheduler)
+"""
+PRIORITY = _enum(INTERACTIVE=0, NORMAL=1, BULK=2)
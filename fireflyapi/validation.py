@@ -0,0 +1,160 @@
+"""
+Offline validation of device records (hex formats and lengths, OTAA/ABP field consistency, duplicates within a batch),
+so bulk imports only send clean records to Device.create.
+
+    report = validate_devices(csv.DictReader(open('import.csv')))
+    for issue in report.errors:
+        print(issue.index, issue.eui, '; '.join(issue.issues))
+    for issue in report.warnings:      # i.e. session keys of joined OTAA devices, not sent on create
+        print(issue.index, issue.eui, '; '.join(issue.issues))
+    for rec in report.valid:
+        Device(api, **rec).create()
+"""
+import re
+from collections import namedtuple
+from . import string_types
+
+
+"""
+Hex encoded fields and their length in characters
+"""
+HEX_LENGTHS = {
+    'eui': 16,
+    'address': 8,
+    'network_session_key': 32,
+    'application_session_key': 32,
+    'application_key': 32
+}
+
+_OTAA_FIELDS = ('application_key',)
+_ABP_FIELDS = ('address', 'network_session_key', 'application_session_key')
+
+_HEX = dict((n, re.compile(r'[0-9a-fA-F]{%d}\Z' % n)) for n in set(HEX_LENGTHS.values()))
+
+"""
+Issues of a single record of a batch: index within the batch, eui as given and list of issue messages
+"""
+RecordIssues = namedtuple('RecordIssues', ['index', 'eui', 'issues'])
+
+
+def _given(value):
+    return value is not None and value != ''
+
+
+def _flag(value):
+    if(isinstance(value, string_types)):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def check_formats(record):
+    """
+    Check the format of the hex fields present in a record
+    :param record: dict of device fields
+    :return: list of issue messages (empty if fine)
+    """
+    issues = []
+    for field, length in HEX_LENGTHS.items():
+        value = record.get(field)
+        if(not _given(value)):
+            continue
+        if(not isinstance(value, string_types) or not _HEX[length].match(value)):
+            issues.append('%s must be %d hex characters, got %r' % (field, length, value))
+    return issues
+
+
+def _mode(record):
+    if(_flag(record.get('otaa'))):
+        return _OTAA_FIELDS, _ABP_FIELDS, 'OTAA'
+    return _ABP_FIELDS, _OTAA_FIELDS, 'ABP'
+
+
+def validate_device(record):
+    """
+    Validate a device record for creation: formats and the fields required by its activation mode
+    :param record: dict of device fields
+    :return: list of issue messages (empty if fine)
+    """
+    issues = check_formats(record)
+
+    if(not _given(record.get('eui'))):
+        issues.append('eui is missing')
+
+    required, _, mode = _mode(record)
+    for field in required:
+        if(not _given(record.get(field))):
+            issues.append('%s is required for %s devices' % (field, mode))
+
+    return issues
+
+
+def device_warnings(record):
+    """
+    Fields of the other activation mode (i.e. address and session keys of joined OTAA devices), they are not sent on
+    create but don't make the record invalid
+    :param record: dict of device fields
+    :return: list of warning messages (empty if none)
+    """
+    _, ignored, mode = _mode(record)
+    return ['%s is not used by %s devices' % (field, mode) for field in ignored if _given(record.get(field))]
+
+
+class ValidationReport(object):
+    """
+    Result of validate_devices: valid records in batch order, RecordIssues of the invalid ones and warnings
+    (RecordIssues of records that are valid nevertheless)
+    """
+
+    def __init__(self, valid, errors, warnings=None):
+        self.valid = valid
+        self.errors = errors
+        self.warnings = warnings or []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __len__(self):
+        return len(self.valid) + len(self.errors)
+
+
+def validate_devices(records):
+    """
+    Validate a batch of device records in a single pass. Besides the per record checks (see validate_device) EUIs and
+    addresses have to be unique within the batch, later duplicates are reported as invalid.
+    :param records: iterable of device dicts (i.e. csv.DictReader rows or load_desired_state output)
+    :return: ValidationReport
+    """
+    valid = []
+    errors = []
+    warnings = []
+    euis = {}
+    addresses = {}
+
+    for index, rec in enumerate(records):
+        issues = validate_device(rec)
+
+        eui = rec.get('eui')
+        if(_given(eui)):
+            key = str(eui).lower()
+            first = euis.setdefault(key, index)
+            if(first != index):
+                issues.append('duplicate eui, first used by record %d' % first)
+
+        address = rec.get('address')
+        if(_given(address)):
+            key = str(address).lower()
+            first = addresses.setdefault(key, index)
+            if(first != index):
+                issues.append('duplicate address, first used by record %d' % first)
+
+        if(issues):
+            errors.append(RecordIssues(index, eui, issues))
+        else:
+            valid.append(rec)
+
+        notes = device_warnings(rec)
+        if(notes):
+            warnings.append(RecordIssues(index, eui, notes))
+
+    return ValidationReport(valid, errors, warnings)
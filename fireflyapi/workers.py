@@ -0,0 +1,320 @@
+"""
+Multi-process fleet worker runtime. Devices are partitioned by consistent hash of their EUI across worker processes,
+each process runs its own API instance (connection pool, share of the rate limit) and calls a task for each of its
+devices every round. Results of all workers are collected through one shared output queue.
+
+    def poll(api, device, state):
+        ...  # return an iterable of picklable results
+
+    fleet = FleetWorkers(poll_uplinks, euis, token='...', processes=8, rate_limit=40, interval=30)
+    fleet.start()
+    for res in fleet.results():
+        ...
+    fleet.add_worker()    # devices move only from the existing workers to the new one
+
+Tasks must be module level functions (they are pickled to the worker processes). The per device state dict lives in
+the owning worker, devices moved on rebalancing start with an empty state on their new worker.
+"""
+import time
+import bisect
+import logging
+import hashlib
+import multiprocessing
+from collections import namedtuple
+from . import logger
+from .util import to_timestamp, to_iso
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+"""
+Output queue entry: worker id, device eui, result (None on error) and error message (None on success)
+"""
+WorkerResult = namedtuple('WorkerResult', ['worker', 'eui', 'result', 'error'])
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """
+    Consistent hash ring, adding or removing a node only moves the keys of that node
+
+    :param nodes    : initial node ids
+    :param replicas : virtual nodes per node (more replicas, more even distribution)
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self._ring = []
+        self._nodes = {}
+        for n in nodes:
+            self.add(n)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = _hash('%s#%s' % (node, i))
+            bisect.insort(self._ring, h)
+            self._nodes[h] = node
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            h = _hash('%s#%s' % (node, i))
+            if(self._nodes.get(h) == node):
+                del self._nodes[h]
+                self._ring.pop(bisect.bisect_left(self._ring, h))
+
+    def node(self, key):
+        """
+        :return: node id owning key (None if the ring is empty)
+        """
+        if(not self._ring):
+            return None
+        i = bisect.bisect(self._ring, _hash(key.lower())) % len(self._ring)
+        return self._nodes[self._ring[i]]
+
+    def partition(self, keys):
+        """
+        :return: dict node id -> list of keys
+        """
+        ret = dict((n, []) for n in set(self._nodes.values()))
+        for k in keys:
+            ret[self.node(k)].append(k)
+        return ret
+
+
+def poll_uplinks(api, device, state, chunksize=100):
+    """
+    Built-in task: new up-packets of a device since the last round as UpRecords (oldest first). The first round starts
+    with the packets received after state['start'] (if set) or the latest packet. All packets after the cursor are
+    paged through, packets of the cursor's second are returned again by firefly (second precision) and are dropped by
+    their (fcnt, received_at) kept in state['seen'].
+    """
+    from .records import up_record_from_packet
+
+    received_after = state.get('received_after', state.get('start', 0))
+    if(not received_after):
+        _, packets = device.get_up_packets(limit_to_last=1)
+    else:
+        packets = []
+        offset = 0
+        while(True):
+            (_, count), page = device.get_up_packets(limit_to_last=chunksize, offset=offset,
+                                                     received_after=to_iso(received_after))
+            packets.extend(page)
+            offset += chunksize
+            if(offset >= count):
+                break
+
+    seen = state.get('seen', set())
+    ret = []
+    for p in packets:
+        if(p is None):
+            continue
+        rec = up_record_from_packet(p)
+        key = (rec.fcnt, rec.received_at)
+        if(key not in seen):
+            seen.add(key)
+            ret.append(rec)
+
+    if(ret):
+        ret.sort(key=lambda r: to_timestamp(r.received_at))
+        cursor = to_timestamp(ret[-1].received_at)
+        state['received_after'] = cursor
+        state['seen'] = set(k for k in seen if to_timestamp(k[1]) >= int(cursor))
+    return ret
+
+
+def _worker_main(wid, task, token, api_args, control, output, interval):
+    from .api import API
+
+    api = API(token=token, **api_args)
+    euis = []
+    devices = {}
+    states = {}
+    next_round = time.time()
+
+    def _handle(msg):
+        if(msg[0] == 'stop'):
+            return False
+        _, assigned, rate = msg
+        for eui in (set(devices) | set(states)) - set(assigned):
+            devices.pop(eui, None)
+            states.pop(eui, None)
+        euis[:] = sorted(assigned)
+        api.set_rate_limit(rate)
+        return True
+
+    def _poll_control(timeout):
+        # returns False on stop, True if the assignment changed
+        try:
+            msg = control.get(timeout=timeout) if timeout > 0 else control.get_nowait()
+        except queue.Empty:
+            return None
+        return _handle(msg)
+
+    while(True):
+        changed = _poll_control(max(next_round - time.time(), 0))
+        if(changed is False):
+            return
+        if(changed and any(eui not in states for eui in euis)):
+            # new devices are polled right away, not only after the current interval
+            next_round = time.time()
+        if(changed or time.time() < next_round):
+            continue
+
+        next_round = time.time() + interval
+        for eui in list(euis):
+            changed = _poll_control(0)
+            if(changed is False):
+                return
+            if(changed and eui not in euis):
+                continue
+
+            try:
+                device = devices.get(eui)
+                if(device is None):
+                    device = devices[eui] = api.get_device(eui=eui)
+                for res in task(api, device, states.setdefault(eui, {})) or ():
+                    output.put(WorkerResult(wid, eui, res, None))
+            except Exception as e:
+                logger.warning('worker %s: task failed for %s: %s' % (wid, eui, e))
+                output.put(WorkerResult(wid, eui, None, str(e)))
+
+
+class FleetWorkers(object):
+    """
+    Sharded worker runtime
+
+    :param task       : module level function task(api, device, state) returning an iterable of picklable results,
+                        state is a dict kept per device between rounds
+    :param euis       : device EUIs to work on
+    :param token      : API token, every worker creates its own API instance
+    :param processes  : number of worker processes (defaults to the number of cpus)
+    :param rate_limit : total requests per second of all workers, shared proportionally to the assigned devices
+    :param interval   : seconds between the starts of two rounds of a worker
+    :param api_args   : further API arguments (server, pool_size, ...), loglevel defaults to WARNING
+    :param queue_size : output queue bound, workers block if results are not consumed
+    """
+
+    def __init__(self, task, euis, token, processes=None, rate_limit=None, interval=60, api_args=None,
+                 queue_size=10000):
+        self.task = task
+        self.euis = list(euis)
+        self.token = token
+        self.rate_limit = rate_limit
+        self.interval = interval
+        self.api_args = dict(api_args or {})
+        self.api_args.setdefault('loglevel', logging.WARNING)
+
+        self._ctx = multiprocessing.get_context() if hasattr(multiprocessing, 'get_context') else multiprocessing
+        self.output = self._ctx.Queue(queue_size)
+        self._ring = HashRing()
+        self._workers = {}
+        self._next_id = 0
+        self._initial = processes or multiprocessing.cpu_count()
+        self._started = False
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        if(self._started):
+            return
+        self._started = True
+        for _ in range(self._initial):
+            self._spawn()
+        self._rebalance()
+
+    def _spawn(self):
+        wid = self._next_id
+        self._next_id += 1
+        control = self._ctx.Queue()
+        proc = self._ctx.Process(target=_worker_main, name='fireflyapi-worker-%s' % wid,
+                                 args=(wid, self.task, self.token, self.api_args, control, self.output, self.interval))
+        proc.daemon = True
+        proc.start()
+        self._workers[wid] = (proc, control)
+        self._ring.add(wid)
+        return wid
+
+    def _rebalance(self):
+        parts = self.assignment()
+        for wid, (proc, control) in self._workers.items():
+            assigned = parts.get(wid, [])
+            # workers without devices make no requests, so the shares add up to rate_limit
+            rate = None
+            if(self.rate_limit and assigned):
+                rate = self.rate_limit * len(assigned) / float(len(self.euis))
+            control.put(('assign', assigned, rate))
+
+    def assignment(self):
+        """
+        :return: dict worker id -> list of EUIs
+        """
+        return self._ring.partition(self.euis)
+
+    def add_worker(self):
+        """
+        Start another worker and move its share of the devices to it
+        :return: worker id
+        """
+        wid = self._spawn()
+        self._rebalance()
+        return wid
+
+    def remove_worker(self, wid=None):
+        """
+        Stop a worker (the latest one by default), its devices move to the remaining workers
+        """
+        if(wid is None):
+            wid = max(self._workers)
+        proc, control = self._workers.pop(wid)
+        self._ring.remove(wid)
+        control.put(('stop',))
+        self._rebalance()
+        proc.join(self.interval)
+
+    def set_devices(self, euis):
+        """
+        Replace the device list, only added and removed devices change their worker
+        """
+        self.euis = list(euis)
+        if(self._started):
+            self._rebalance()
+
+    def results(self, timeout=None):
+        """
+        Generator over the shared output queue
+        :param timeout: stop after timeout seconds without results, None waits forever
+        :return: generator providing WorkerResults
+        """
+        while(True):
+            try:
+                yield self.output.get(timeout=timeout)
+            except queue.Empty:
+                return
+
+    def stop(self, wait=True):
+        """
+        Stop all workers
+        """
+        for proc, control in self._workers.values():
+            control.put(('stop',))
+        if(wait):
+            for proc, _ in self._workers.values():
+                proc.join(self.interval)
+        for wid in list(self._workers):
+            self._ring.remove(wid)
+        self._workers.clear()
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,58 @@
+"""
+Fake transport for offline tests: requests are answered by route handlers instead of the firefly server
+"""
+import json
+import threading
+from fireflyapi import HTTP_VERBS
+from fireflyapi.api import API
+from fireflyapi.cassette import ReplayResponse
+
+
+class FakeTransport(object):
+    """
+    :param routes : dict (verb name, endpoint) -> handler(endpoint, query, data) returning the json body (or a
+                    (status, body) tuple), endpoints ending with '*' match by prefix
+    :param delay  : seconds every request takes
+    """
+
+    def __init__(self, routes=None, delay=0):
+        self.routes = dict(routes or {})
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def _handler(self, verb, endpoint):
+        if((verb, endpoint) in self.routes):
+            return self.routes[(verb, endpoint)]
+        for (v, e), handler in self.routes.items():
+            if(v == verb and e.endswith('*') and endpoint.startswith(e[:-1])):
+                return handler
+        return None
+
+    def send(self, api, method, endpoint, url, query, data):
+        verb = HTTP_VERBS.reverse_mapping[method]
+        with self._lock:
+            self.requests.append((verb, endpoint, dict((k, v) for k, v in (query or {}).items() if k != 'auth'), data))
+
+        if(self.delay):
+            import time
+            time.sleep(self.delay)
+
+        handler = self._handler(verb, endpoint)
+        if(handler is None):
+            return ReplayResponse(404, {'content-type': 'application/json'}, b'{"error": "not found"}')
+
+        body = handler(endpoint, query, data) if callable(handler) else handler
+        status = 200
+        if(isinstance(body, tuple)):
+            status, body = body
+        return ReplayResponse(status, {'content-type': 'application/json'}, json.dumps(body).encode('utf-8'))
+
+
+def fake_api(routes=None, **args):
+    """
+    :return: tuple (API using a FakeTransport, the transport)
+    """
+    transport = FakeTransport(routes, delay=args.pop('delay', 0))
+    args.setdefault('loglevel', 40)
+    return API(token='test', transport=transport, **args), transport
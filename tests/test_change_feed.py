@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fireflyapi.change_feed import DeviceChangeFeed
+from tests.fake import fake_api
+
+
+def _device(eui, name, updated='2017-03-01T10:00:00'):
+    return {'eui': eui, 'name': name, 'otaa': True, 'updated_at': updated}
+
+
+class ChangeFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'inventory.state')
+        self.devices = [_device('00000000000000aa', 'a'), _device('00000000000000bb', 'b')]
+        self.api, _ = fake_api({('GET', 'devices'): lambda e, q, d: {'devices': [dict(d) for d in self.devices]}})
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _events(self, changes):
+        return sorted((c.event, c.eui) for c in changes)
+
+    def test_changes_relative_to_the_committed_state(self):
+        feed = DeviceChangeFeed(self.api, state_path=self.path)
+        self.assertEqual(self._events(feed.poll()), [('created', '00000000000000aa'), ('created', '00000000000000bb')])
+        feed.commit()
+        self.assertEqual(feed.poll(), [])
+
+        self.devices[0] = _device('00000000000000aa', 'renamed')
+        del self.devices[1]
+        self.assertEqual(self._events(feed.poll()), [('removed', '00000000000000bb'), ('updated', '00000000000000aa')])
+
+    def test_uncommitted_changes_are_emitted_again(self):
+        feed = DeviceChangeFeed(self.api, state_path=self.path)
+        feed.commit()
+        self.assertEqual(len(feed.poll()), 2)
+
+        # crash before commit: a new feed on the same state file gets the changes again
+        feed = DeviceChangeFeed(self.api, state_path=self.path)
+        self.assertEqual(len(feed.poll()), 2)
+        feed.commit()
+
+        feed = DeviceChangeFeed(self.api, state_path=self.path)
+        self.assertEqual(len(feed.state), 2)
+        self.assertEqual(feed.poll(), [])
+
+    def test_follow_commits_after_the_batch(self):
+        feed = DeviceChangeFeed(self.api, state_path=self.path)
+        changes = feed.follow(interval=0)
+        next(changes)
+        self.assertFalse(os.path.exists(self.path))
+        next(changes)
+        self.assertFalse(os.path.exists(self.path))
+
+        self.devices.append(_device('00000000000000cc', 'c'))
+        self.assertEqual(next(changes).eui, '00000000000000cc')
+        self.assertEqual(len(DeviceChangeFeed(self.api, state_path=self.path).state), 2)
+
+    def test_first_poll_without_initial_events(self):
+        feed = DeviceChangeFeed(self.api, initial=False)
+        self.assertEqual(feed.poll(), [])
+        feed.commit()
+        self.assertEqual(len(feed.state), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from fireflyapi.cli import build_parser, dump
+from tests.fake import fake_api
+
+_EUIS = ['00000000000000aa', '00000000000000bb']
+
+
+def _routes(fail):
+    def packets(endpoint, query, data):
+        eui = endpoint.split('/')[2]
+        limit, offset = int(query['limit_to_last']), int(query.get('offset', 0))
+        if(eui in fail and offset):
+            return 500, {'error': 'boom'}
+        packets = [{'fcnt': n, 'payload': '%s-%d' % (eui, n)} for n in range(5)]
+        return {'count': 5, 'packets': packets[offset:offset + limit]}
+
+    return {
+        ('GET', 'devices'): {'devices': [{'eui': eui} for eui in _EUIS]},
+        ('GET', 'devices/eui/*'): packets
+    }
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, 'out.ndjson')
+        self.state = os.path.join(self.dir, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _dump(self, fail=()):
+        api, _ = fake_api(_routes(fail))
+        args = build_parser().parse_args(['dump', 'packets', '-o', self.output, '--resume', self.state,
+                                          '--chunksize', '2', '-j', '2'])
+        return dump(args, api=api)
+
+    def _payloads(self):
+        with open(self.output) as f:
+            return sorted(json.loads(l)['payload'] for l in f)
+
+    def test_partly_dumped_device_is_not_duplicated(self):
+        self.assertEqual(self._dump(fail=[_EUIS[1]]), 1)
+        self.assertEqual(self._payloads(), ['%s-%d' % (_EUIS[0], n) for n in range(5)])
+
+        self.assertEqual(self._dump(), 0)
+        self.assertEqual(self._payloads(), sorted('%s-%d' % (eui, n) for eui in _EUIS for n in range(5)))
+
+    def test_interrupted_append_is_dropped(self):
+        self._dump(fail=[_EUIS[1]])
+        with open(self.output, 'a') as f:
+            f.write('{"payload": "partial"')
+
+        self._dump()
+        self.assertEqual(len(self._payloads()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import time
+import unittest
+from datetime import datetime
+from fireflyapi import PAYLOAD_ENCODING
+from fireflyapi.delivery import DeliveryTracker
+from fireflyapi.device import Device
+from tests.fake import fake_api
+
+_EUI = '00000000000000aa'
+
+
+def _now_iso(offset=0):
+    return datetime.utcfromtimestamp(time.time() + offset).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class DeliveryTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.down = []
+        self.api, self.transport = fake_api({
+            ('POST', 'devices/eui/%s/packet' % _EUI): {'packet': {}},
+            ('GET', 'devices/eui/%s/down_packets' % _EUI): lambda e, q, d: {'count': len(self.down),
+                                                                            'packets': list(self.down)}
+        })
+        self.device = Device(self.api, eui=_EUI, _exists=True)
+        self.tracker = DeliveryTracker(self.api, timeout=60)
+
+    def _down(self, payload, sent=True, ack=False, fcnt=0):
+        packet = {'payload': payload, 'sent': sent, 'ack': ack, 'received_at': _now_iso(), 'frame_counter': fcnt}
+        self.down.append(packet)
+        return packet
+
+    def test_confirmed_downlink_waits_for_the_ack(self):
+        future = self.tracker.send(self.device, 'DEADBEEF', encoding=PAYLOAD_ENCODING.BASE16, confirmed=True)
+        posted = [r[3] for r in self.transport.requests if r[0] == 'POST'][0]
+        self.assertTrue(posted['confirmed'])
+
+        packet = self._down('deadbeef')
+        self.assertEqual(self.tracker.sweep(), 1)
+        self.assertFalse(future.done())
+
+        packet['ack'] = True
+        self.assertEqual(self.tracker.sweep(), 0)
+        self.assertEqual(future.result(0).status, 'ack')
+
+    def test_unconfirmed_downlink_is_done_once_sent(self):
+        future = self.tracker.send(self.device, 'DEADBEEF', encoding=PAYLOAD_ENCODING.BASE16)
+        posted = [r[3] for r in self.transport.requests if r[0] == 'POST'][0]
+        self.assertNotIn('confirmed', posted)
+
+        self._down('deadbeef')
+        self.tracker.sweep()
+        self.assertEqual(future.result(0).status, 'sent')
+
+    def test_matched_packet_does_not_confirm_a_later_downlink(self):
+        first = self.tracker.send(self.device, 'DEADBEEF', encoding=PAYLOAD_ENCODING.BASE16)
+        self._down('deadbeef', fcnt=1)
+        self.tracker.sweep()
+        self.assertEqual(first.result(0).packet.frame_counter, 1)
+
+        second = self.tracker.send(self.device, 'DEADBEEF', encoding=PAYLOAD_ENCODING.BASE16)
+        self.assertEqual(self.tracker.sweep(), 1)
+        self.assertFalse(second.done())
+
+        self._down('deadbeef', fcnt=2)
+        self.assertEqual(self.tracker.sweep(), 0)
+        self.assertEqual(second.result(0).packet.frame_counter, 2)
+
+    def test_timeout(self):
+        future = self.tracker.track(self.device, 'deadbeef', queued_at=time.time() - 120)
+        self.assertEqual(self.tracker.sweep(), 0)
+        self.assertEqual(future.result(0).status, 'timeout')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+from fireflyapi.device import Device
+from tests.fake import fake_api
+
+_EUI = '00000000000000aa'
+_OTAA = {'eui': _EUI, 'name': 'sensor', 'otaa': True, 'application_key': '00' * 16}
+
+
+def _in_other_thread(func):
+    t = threading.Thread(target=func)
+    t.start()
+    t.join(5)
+    return not t.is_alive()
+
+
+class DeviceLockingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.during = None
+
+        def handler(endpoint, query, data):
+            # another thread edits the device while the request is in flight
+            self.unblocked = _in_other_thread(self.during) if self.during else None
+            device = dict(_OTAA)
+            device.update(data.get('device', {}))
+            return {'device': device}
+
+        self.api, self.transport = fake_api({('PUT', 'devices/eui/%s' % _EUI): handler,
+                                             ('POST', 'devices'): handler}, orga_id=1)
+
+    def test_update_does_not_block_other_threads(self):
+        dev = Device(self.api, _exists=True, **_OTAA)
+        dev.name = 'saved'
+
+        def _edit():
+            dev.description = 'edited meanwhile'
+        self.during = _edit
+        dev.update()
+
+        self.assertTrue(self.unblocked)
+        self.assertEqual(self.transport.requests[-1][3]['name'], 'saved')
+        self.assertEqual(dev.get_changes(), ['description'])
+
+    def test_changed_again_during_update_stays_dirty(self):
+        dev = Device(self.api, _exists=True, **_OTAA)
+        dev.name = 'first'
+
+        def _edit():
+            dev.name = 'second'
+        self.during = _edit
+        dev.update()
+
+        self.assertEqual(self.transport.requests[-1][3]['name'], 'first')
+        self.assertEqual(dev.get_changes(), ['name'])
+        self.assertEqual(dev.name, 'second')
+
+    def test_create_does_not_block_other_threads(self):
+        dev = Device(self.api, **_OTAA)
+
+        def _edit():
+            dev.description = 'edited meanwhile'
+        self.during = _edit
+        dev.create()
+
+        self.assertTrue(self.unblocked)
+        self.assertTrue(dev._exists)
+        self.assertEqual(dev.description, 'edited meanwhile')
+        self.assertEqual(dev.get_changes(), ['description'])
+
+    def test_failed_create_can_be_retried(self):
+        api, _ = fake_api({('POST', 'devices'): (500, {'error': 'boom'})}, orga_id=1)
+        dev = Device(api, **_OTAA)
+        self.assertRaises(Exception, dev.create)
+        self.assertFalse(dev._exists)
+
+
+if __name__ == '__main__':
+    unittest.main()
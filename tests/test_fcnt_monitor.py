@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime
+from fireflyapi.device import Device
+from fireflyapi.fcnt_monitor import FrameCounterMonitor, oldest_first
+from tests.fake import fake_api
+
+_EUI = '00000000000000aa'
+
+
+def _packet(fcnt):
+    return {'fcnt': fcnt, 'received_at': datetime.utcfromtimestamp(1488362400 + fcnt).isoformat()}
+
+
+def _kinds(events):
+    return [(e.kind, e.fcnt, e.count) for e in events]
+
+
+class FrameCounterMonitorTest(unittest.TestCase):
+
+    def _feed(self, monitor, counters):
+        events = []
+        for c in counters:
+            events.extend(monitor.add_counter(_EUI, c))
+        return events
+
+    def test_clean_stream(self):
+        monitor = FrameCounterMonitor()
+        self.assertEqual(self._feed(monitor, range(1000)), [])
+        stats = monitor.stats(_EUI)
+        self.assertEqual((stats.received, stats.lost, stats.resets, stats.last_fcnt), (1000, 0, 0, 999))
+
+    def test_gap_and_late_packet(self):
+        monitor = FrameCounterMonitor()
+        self.assertEqual(_kinds(self._feed(monitor, [1, 2, 5, 6])), [('gap', 3, 2)])
+        self.assertEqual(_kinds(self._feed(monitor, [3])), [('late', 3, 1)])
+        self.assertEqual(monitor.stats(_EUI).lost, 1)
+
+    def test_duplicates(self):
+        monitor = FrameCounterMonitor(window=16)
+        self.assertEqual(_kinds(self._feed(monitor, [20001, 20002, 20003, 20002])), [('duplicate', 20002, 1)])
+        self._feed(monitor, range(20004, 20100))
+        # outside of the window: can't tell, counted as replay
+        self.assertEqual(_kinds(self._feed(monitor, [20050])), [('duplicate', 20050, 1)])
+
+    def test_reset(self):
+        monitor = FrameCounterMonitor()
+        self.assertEqual(_kinds(self._feed(monitor, [40000, 40001, 0, 1])), [('reset', 0, 1)])
+        stats = monitor.stats(_EUI)
+        self.assertEqual((stats.resets, stats.lost, stats.last_fcnt), (1, 0, 1))
+
+    def test_16_bit_rollover(self):
+        monitor = FrameCounterMonitor(counter_bits=16)
+        events = self._feed(monitor, [65534, 65535, 0, 2])
+        self.assertEqual(_kinds(events), [('rollover', 0, 1), ('gap', 1, 1)])
+        stats = monitor.stats(_EUI)
+        self.assertEqual((stats.rollovers, stats.resets, stats.last_fcnt), (1, 0, 2))
+
+    def test_32_bit_rollover(self):
+        monitor = FrameCounterMonitor(counter_bits=32)
+        self.assertEqual(_kinds(self._feed(monitor, [0xFFFFFFFE, 0xFFFFFFFF, 0])), [('rollover', 0, 1)])
+        # a 16 bit wrap is a reset for 32 bit counters
+        monitor = FrameCounterMonitor(counter_bits=32)
+        self.assertEqual(_kinds(self._feed(monitor, [65534, 65535, 0])), [('reset', 0, 1)])
+
+
+class OldestFirstTest(unittest.TestCase):
+
+    def setUp(self):
+        self.packets = [_packet(n) for n in range(1000)]
+
+        def packets(endpoint, query, data):
+            # newest first, offset skips the newest packets
+            limit, offset = int(query['limit_to_last']), int(query.get('offset', 0))
+            newest = self.packets[::-1]
+            self.requests += 1
+            if(self.arriving and self.requests % 3 == 0):
+                self.packets.append(_packet(len(self.packets)))
+            return {'count': len(newest), 'packets': newest[offset:offset + limit]}
+
+        self.arriving = False
+        self.requests = 0
+        self.api, _ = fake_api({('GET', 'devices/eui/%s/packets' % _EUI): packets})
+        self.device = Device(self.api, eui=_EUI, _exists=True)
+
+    def test_history_in_pages(self):
+        monitor = FrameCounterMonitor()
+        events = list(monitor.events(oldest_first(self.device, chunksize=100)))
+        self.assertEqual(events, [])
+        stats = monitor.stats(_EUI)
+        self.assertEqual((stats.received, stats.lost, stats.resets, stats.last_fcnt), (1000, 0, 0, 999))
+
+    def test_packets_received_while_paging(self):
+        self.arriving = True
+        fcnts = [p.fcnt for p in oldest_first(self.device, chunksize=100)]
+        self.assertEqual(fcnts, list(range(1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
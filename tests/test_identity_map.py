@@ -0,0 +1,59 @@
+import unittest
+from tests.fake import fake_api
+
+_EUI = '00000000000000aa'
+
+
+class IdentityMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = {'eui': _EUI, 'name': 'remote', 'otaa': True, 'application_key': '00' * 16}
+        self.api, self.transport = fake_api({
+            ('GET', 'devices'): lambda e, q, d: {'devices': [dict(self.remote)]},
+            ('GET', 'devices/eui/%s' % _EUI): lambda e, q, d: {'device': dict(self.remote)},
+            ('GET', 'applications/'): {'applications': [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]},
+            ('GET', 'device_classes/'): {'device_classes': [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}]}
+        })
+
+    def _requests(self, endpoint):
+        return len([r for r in self.transport.requests if r[1] == endpoint])
+
+    def test_devices_are_shared(self):
+        listed = [d for d in self.api.get_devices()][0]
+        self.assertIs(self.api.get_device(eui=_EUI), listed)
+
+    def test_relisting_updates_in_place(self):
+        dev = list(self.api.get_devices())[0]
+        self.remote['name'] = 'renamed'
+        self.assertIs(list(self.api.get_devices())[0], dev)
+        self.assertEqual(dev.name, 'renamed')
+
+    def test_relisting_keeps_local_changes(self):
+        dev = list(self.api.get_devices())[0]
+        dev.name = 'local-edit'
+        self.remote['description'] = 'new'
+
+        list(self.api.get_devices())
+        self.assertEqual(dev.name, 'local-edit')
+        self.assertEqual(dev.description, 'new')
+        self.assertEqual(dev.get_changes(), ['name'])
+
+        dev.pull()
+        self.assertEqual(dev.name, 'remote')
+        self.assertEqual(dev.get_changes(), [])
+
+    def test_partly_consumed_listing(self):
+        next(self.api.get_applications())
+        self.assertEqual(self.api.get_application(2).name, 'b')
+        next(self.api.get_device_classes())
+        self.assertEqual(self.api.get_device_class(2).name, 'b')
+
+    def test_listing_is_fetched_once(self):
+        self.assertEqual(self.api.get_application(1).name, 'a')
+        self.assertIsNone(self.api.get_application(3))
+        self.assertIs(self.api.get_application(1), self.api.get_application(1))
+        self.assertEqual(self._requests('applications/'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
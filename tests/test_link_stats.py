@@ -0,0 +1,49 @@
+import unittest
+from fireflyapi.device import Device
+from fireflyapi.packet import UpPacket
+from fireflyapi.link_stats import LinkQualityAggregator
+from fireflyapi.records import up_record_from_packet
+
+
+def _packet(**args):
+    args.setdefault('received_at', '2017-03-01T10:00:00')
+    args.setdefault('freq', 868.1)
+    args.setdefault('spreading_factor', 7)
+    return UpPacket(Device(None, eui='0011223344556677', _exists=True), **args)
+
+
+class ReceptionsTest(unittest.TestCase):
+
+    def test_packet_without_gwrx_has_no_receptions(self):
+        self.assertEqual(_packet().receptions(), [])
+
+    def test_single_and_multiple_receptions(self):
+        rx = {'gweui': '00000000000000aa', 'rssi': -80, 'lsnr': 5.0}
+        self.assertEqual(_packet(gwrx=rx).receptions(), [rx])
+        self.assertEqual(_packet(gwrx=[rx, rx]).receptions(), [rx, rx])
+
+    def test_record_without_gwrx(self):
+        rec = up_record_from_packet(_packet())
+        self.assertIsNone(rec.rssi)
+        self.assertIsNone(rec.gweui)
+
+
+class LinkQualityAggregatorTest(unittest.TestCase):
+
+    def test_packets_without_gateway_are_not_aggregated_per_gateway(self):
+        agg = LinkQualityAggregator()
+        agg.add(_packet())
+        agg.add(_packet(gwrx={'rssi': -90, 'lsnr': 1.0}))
+        agg.add(_packet(gwrx=[{'gweui': 'aa', 'rssi': -100, 'lsnr': -2.0}, {'gweui': 'bb', 'rssi': -60, 'lsnr': 8.0}]))
+
+        gateways = agg.gateways(by_bucket=False)
+        self.assertEqual(sorted(gateways), ['aa', 'bb'])
+        self.assertEqual(gateways['aa'].rssi.mean, -100)
+        self.assertEqual(agg.packets, 3)
+
+        channel = agg.channels(by_bucket=False)[(868.1, 7)]
+        self.assertEqual(channel.rssi.max, -60)
+
+
+if __name__ == '__main__':
+    unittest.main()
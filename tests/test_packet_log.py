@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fireflyapi.packet_log import PacketLogReader, PacketLogWriter, RECORD_SIZE
+from fireflyapi.records import UpRecord
+
+_EUIS = ['00000000000000aa', '00000000000000bb']
+
+
+def _record(n):
+    return UpRecord(_EUIS[n % 2], 1488362400.0 + n, n, 1, 868.1, 7, -80.0 - n, 5.0, None, 'payload-%d' % n, None)
+
+
+class PacketLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'uplinks')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, numbers):
+        with PacketLogWriter(self.path) as log:
+            log.extend(_record(n) for n in numbers)
+
+    def _check(self, numbers):
+        with PacketLogReader(self.path) as reader:
+            self.assertEqual(list(reader.scan()), [_record(n) for n in numbers])
+            for eui in _EUIS:
+                self.assertEqual([r.fcnt for r in reader.range(eui)], [n for n in numbers if _record(n).eui == eui])
+            self.assertEqual([r.fcnt for r in reader.range(_EUIS[0], 1488362402.0, 1488362406.0)], [2, 4])
+
+    def test_round_trip(self):
+        self._write(range(10))
+        self._write(range(10, 20))
+        self._check(range(20))
+
+    def test_torn_tails_are_recovered(self):
+        self._write(range(10))
+        for ext, junk in (('.rec', 20), ('.dat', 7), ('.idx', 5)):
+            with open(self.path + ext, 'ab') as f:
+                f.write(b'\x01' * junk)
+
+        self._write(range(10, 20))
+        self.assertEqual(os.path.getsize(self.path + '.rec'), 20 * RECORD_SIZE)
+        self._check(range(20))
+
+    def test_records_without_payload_or_index_are_dropped_or_reindexed(self):
+        self._write(range(10))
+        # crash after the records: last payload partly written, index entries of the last records missing
+        with open(self.path + '.dat', 'r+b') as f:
+            f.truncate(os.path.getsize(self.path + '.dat') - 2)
+        with open(self.path + '.idx', 'r+b') as f:
+            f.truncate(os.path.getsize(self.path + '.idx') * 6 // 10)
+
+        self._write(range(9, 20))
+        self._check(range(20))
+
+
+if __name__ == '__main__':
+    unittest.main()
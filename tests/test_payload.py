@@ -0,0 +1,61 @@
+import unittest
+from fireflyapi import PAYLOAD_ENCODING
+from fireflyapi.api_exception import APIException
+from fireflyapi.device import _encode_payload
+from fireflyapi.payload import PayloadSchema
+
+_FIELDS = [('interval', 'u16'), ('mode', 'bits:4'), ('led', 'bits:1'), ('pad', 'bits:3'), ('threshold', 'f32'),
+           ('offset', 'i8')]
+
+
+class PayloadSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            {'interval': 300, 'mode': 5, 'led': 1, 'pad': 0, 'threshold': 1.5, 'offset': -2},
+            {'interval': 0xFFFF, 'mode': 15, 'led': 0, 'pad': 7, 'threshold': -0.25, 'offset': 127},
+        ]
+        self.columns = dict((k, [r[k] for r in self.rows]) for k in self.rows[0])
+
+    def test_layout_and_byte_order(self):
+        self.assertEqual(PayloadSchema(_FIELDS).encode(self.rows[0]), '012c' + '58' + '3fc00000' + 'fe')
+        self.assertEqual(PayloadSchema(_FIELDS, byteorder='little').encode(self.rows[0]),
+                         '2c01' + '58' + '0000c03f' + 'fe')
+
+    def test_batch_matches_single_encoding(self):
+        for order in ('big', 'little'):
+            schema = PayloadSchema(_FIELDS, byteorder=order)
+            for encoding in (PAYLOAD_ENCODING.BASE16, PAYLOAD_ENCODING.BASE64, None):
+                single = [schema.encode(r, encoding=encoding) for r in self.rows]
+                self.assertEqual(schema.encode_batch(self.columns, encoding=encoding), single)
+                self.assertEqual(schema.encode_batch(self.rows, encoding=encoding), single)
+
+    def test_broadcast_scalars(self):
+        schema = PayloadSchema(_FIELDS)
+        columns = dict(self.columns, led=1, pad=0)
+        rows = [dict(r, led=1, pad=0) for r in self.rows]
+        self.assertEqual(schema.encode_batch(columns), [schema.encode(r) for r in rows])
+
+    def test_floats_are_rejected_for_integer_fields(self):
+        schema = PayloadSchema([('a', 'u8'), ('b', 'bits:4'), ('c', 'bits:4')])
+        for values in ({'a': 1.7, 'b': 1, 'c': 1}, {'a': 1, 'b': 1.0, 'c': 1}):
+            self.assertRaises(APIException, schema.encode, values)
+            self.assertRaises(APIException, schema.encode_batch, dict((k, [v]) for k, v in values.items()))
+
+    def test_range_checks(self):
+        schema = PayloadSchema([('a', 'u8')])
+        self.assertRaises(APIException, schema.encode, {'a': 256})
+        self.assertRaises(APIException, schema.encode_batch, {'a': [1, 256]})
+        self.assertRaises(APIException, PayloadSchema, [('a', 'bits:3')])
+
+
+class EncodePayloadTest(unittest.TestCase):
+
+    def test_numbers_are_big_endian(self):
+        self.assertEqual(_encode_payload(1, PAYLOAD_ENCODING.BASE64), 'AAAAAQ==')
+        self.assertEqual(_encode_payload(1.0, PAYLOAD_ENCODING.BASE64), 'P4AAAA==')
+        self.assertEqual(_encode_payload(-1, PAYLOAD_ENCODING.BASE64), '/////w==')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import threading
+import unittest
+from fireflyapi.pipeline import PagePipeline
+
+
+def _pages(n, per_page=10):
+    for i in range(n):
+        packets = [{'fcnt': i * per_page + j, 'received_at': '2017-03-01T10:00:00', 'payload': 'ab'}
+                   for j in range(per_page)]
+        yield '0011223344556677', json.dumps({'packets': packets})
+
+
+class PagePipelineTest(unittest.TestCase):
+
+    def _run(self, target, timeout=30):
+        t = threading.Thread(target=target)
+        t.daemon = True
+        t.start()
+        t.join(timeout)
+        self.assertFalse(t.is_alive(), 'pipeline did not shut down')
+
+    def test_decodes_all_pages_in_order(self):
+        with PagePipeline(processes=2, batch_pages=2, max_pending=4) as pl:
+            fcnts = [r.fcnt for r in pl.map(_pages(20))]
+        self.assertEqual(fcnts, list(range(200)))
+
+    def test_early_exit_does_not_hang(self):
+        def _consume():
+            with PagePipeline(processes=2, batch_pages=2, max_pending=16) as pl:
+                for n, r in enumerate(pl.map(_pages(1000))):
+                    if(n == 5):
+                        break
+        self._run(_consume)
+
+    def test_early_exit_of_page_generator(self):
+        def _consume():
+            with PagePipeline(processes=2, batch_pages=1, max_pending=2, ordered=False) as pl:
+                pages = pl.map_pages(_pages(1000))
+                next(pages)
+                pages.close()
+        self._run(_consume)
+
+
+if __name__ == '__main__':
+    unittest.main()
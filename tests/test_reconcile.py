@@ -0,0 +1,43 @@
+import unittest
+from fireflyapi.reconcile import FleetReconciler, normalize_record
+from tests.fake import fake_api
+
+_EUI = '00000000000000aa'
+
+
+class ReconcileUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = {'eui': _EUI, 'name': 'sensor', 'otaa': True, 'application_key': '00' * 16, 'tags': 'a',
+                       'application': 1}
+
+        def put(endpoint, query, data):
+            for k in ('tags', 'application', 'name'):
+                if(k in data):
+                    self.remote[k] = data[k]
+            return {'device': dict(self.remote)}
+
+        self.api, self.transport = fake_api({
+            ('GET', 'devices'): lambda e, q, d: {'devices': [dict(self.remote)]},
+            ('PUT', 'devices/eui/%s' % _EUI): put
+        })
+        self.rec = FleetReconciler(self.api)
+
+    def test_tags_and_application_are_sent(self):
+        desired = [normalize_record({'eui': _EUI, 'tags': 'b,a', 'application': '2'})]
+        plan = self.rec.plan(desired)
+        self.assertEqual(plan.summary()['update'], 1)
+
+        result = self.rec.apply(plan)
+        self.assertEqual((result.updated, result.errors), (1, []))
+
+        body = [r[3] for r in self.transport.requests if r[0] == 'PUT'][0]
+        self.assertIsInstance(body, dict)
+        self.assertEqual(sorted(body['tags'].split(',')), ['a', 'b'])
+        self.assertEqual(body['application'], 2)
+
+        self.assertTrue(self.rec.plan(desired).is_noop)
+
+
+if __name__ == '__main__':
+    unittest.main()
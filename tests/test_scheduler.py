@@ -0,0 +1,118 @@
+import time
+import threading
+import unittest
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from fireflyapi import HTTP_VERBS, PRIORITY
+from fireflyapi.scheduler import RequestScheduler
+from fireflyapi.api_exception import DeadlineExceededError
+from fireflyapi.workers import _worker_main
+from tests.fake import FakeTransport, fake_api
+
+_ROUTES = {('GET', 'devices/eui/*'): lambda e, q, d: {'device': {'eui': e.split('/')[2]}}}
+
+
+def _timed_calls(api, n):
+    started = time.time()
+    for i in range(n):
+        api.call(HTTP_VERBS.GET, 'devices/eui/%016x' % i, coalesce=False)
+    return time.time() - started
+
+
+def _stamp(api, device, state):
+    return [time.time()]
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def test_constructor_rate_limit(self):
+        api, _ = fake_api(_ROUTES, rate_limit=10)
+        self.assertGreaterEqual(_timed_calls(api, 15), 0.4)
+
+    def test_set_rate_limit_without_scheduler(self):
+        api, _ = fake_api(_ROUTES)
+        self.assertLess(_timed_calls(api, 15), 0.4)
+
+        api.set_rate_limit(10)
+        self.assertIsNotNone(api.scheduler)
+        self.assertGreaterEqual(_timed_calls(api, 15), 0.4)
+
+        api.set_rate_limit(None)
+        self.assertLess(_timed_calls(api, 15), 0.4)
+
+    def test_worker_applies_its_share_of_the_rate_limit(self):
+        control, output = queue.Queue(), queue.Queue()
+        api_args = {'transport': FakeTransport(_ROUTES), 'loglevel': 40}
+        control.put(('assign', ['%016x' % i for i in range(8)], 4))
+        worker = threading.Thread(target=_worker_main, args=(0, _stamp, 'test', api_args, control, output, 60))
+        worker.daemon = True
+        worker.start()
+        self.addCleanup(worker.join, 10)
+        self.addCleanup(control.put, ('stop',))
+
+        stamps = [output.get(timeout=10).result for _ in range(8)]
+
+        # one device lookup per device: 4 tokens of burst, the rest at 4 per second
+        self.assertGreaterEqual(max(stamps) - min(stamps), 0.7)
+
+
+class RequestSchedulerTest(unittest.TestCase):
+
+    def test_interactive_requests_are_not_queued_behind_bulk(self):
+        sched = RequestScheduler(concurrency=1)
+        sched.acquire(PRIORITY.BULK)
+        order = []
+
+        def _request(priority):
+            sched.acquire(priority)
+            order.append(priority)
+            sched.release()
+
+        threads = [threading.Thread(target=_request, args=(PRIORITY.BULK,)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        interactive = threading.Thread(target=_request, args=(PRIORITY.INTERACTIVE,))
+        interactive.start()
+        time.sleep(0.1)
+
+        sched.release()
+        for t in threads + [interactive]:
+            t.join(10)
+        self.assertLessEqual(order.index(PRIORITY.INTERACTIVE), 1)
+
+    def test_concurrency_limit(self):
+        sched = RequestScheduler(concurrency=2)
+        active = [0, 0]
+        lock = threading.Lock()
+
+        def _request():
+            sched.acquire()
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            sched.release()
+
+        threads = [threading.Thread(target=_request) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertEqual(active[1], 2)
+
+    def test_deadline(self):
+        sched = RequestScheduler(concurrency=1)
+        sched.acquire()
+        self.assertRaises(DeadlineExceededError, sched.acquire, PRIORITY.NORMAL, time.time() + 0.05)
+        sched.release()
+        sched.acquire(deadline=time.time() + 1)
+        sched.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import asyncio
+import unittest
+from fireflyapi.sink import SinkServer
+
+
+async def _post(port, body, path='/?token=s3cret'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    raw = json.dumps(body).encode('utf-8')
+    writer.write(('POST %s HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (path, len(raw))).encode('latin-1') + raw)
+    await writer.drain()
+    status = await asyncio.wait_for(reader.readline(), 5)
+    writer.close()
+    return int(status.split()[1]) if status else None
+
+
+class SinkServerTest(unittest.TestCase):
+
+    def _run(self, requests, **args):
+        async def _main():
+            server = SinkServer(host='127.0.0.1', port=0, secret='s3cret', **args)
+            await server.start()
+            try:
+                statuses = [await _post(server.port, *r) for r in requests]
+                received = []
+                while(not server.queue.empty()):
+                    received.append(server.queue.get_nowait())
+                return statuses, received
+            finally:
+                await server.stop()
+        return asyncio.run(_main())
+
+    def test_packets_are_queued(self):
+        packet = {'device_eui': '00000000000000AA', 'received_at': '2017-03-01T10:00:00', 'fcnt': 3}
+        statuses, received = self._run([({'packets': [packet, dict(packet, fcnt=4)]},)])
+        self.assertEqual(statuses, [200])
+        self.assertEqual([(r.eui, r.fcnt) for r in received], [('00000000000000aa', 3), ('00000000000000aa', 4)])
+
+    def test_malformed_packets_are_answered(self):
+        statuses, received = self._run([
+            ({'device_eui': '00000000000000aa', 'received_at': 'yesterday'},),
+            ({'device_eui': '00000000000000aa', 'received_at': ['2017']},),
+            ({'device_eui': '00000000000000aa'}, '/?token=wrong'),
+        ])
+        self.assertEqual(statuses, [400, 400, 403])
+        self.assertEqual(received, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
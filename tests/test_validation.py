@@ -0,0 +1,35 @@
+import unittest
+from fireflyapi.validation import validate_device, validate_devices
+
+_OTAA = {'eui': '00000000000000aa', 'otaa': 'true', 'application_key': '00' * 16}
+_ABP = {'eui': '00000000000000bb', 'otaa': False, 'address': '0000abcd', 'network_session_key': '11' * 16,
+        'application_session_key': '22' * 16}
+
+
+class ValidateDeviceTest(unittest.TestCase):
+
+    def test_required_fields_per_mode(self):
+        self.assertEqual(validate_device(_OTAA), [])
+        self.assertEqual(validate_device(_ABP), [])
+        self.assertEqual(validate_device({'eui': '00000000000000aa', 'otaa': True}),
+                         ['application_key is required for OTAA devices'])
+
+    def test_joined_otaa_device_is_valid_with_a_warning(self):
+        joined = dict(_OTAA, address='0000abcd', network_session_key='11' * 16)
+        self.assertEqual(validate_device(joined), [])
+
+        report = validate_devices([joined])
+        self.assertTrue(report.ok)
+        self.assertEqual(report.valid, [joined])
+        self.assertEqual(len(report.warnings), 1)
+        self.assertEqual(report.warnings[0].index, 0)
+
+    def test_duplicates_and_formats(self):
+        report = validate_devices([_ABP, dict(_ABP, eui='00000000000000cc'), dict(_OTAA, eui='xyz')])
+        self.assertEqual(len(report.valid), 1)
+        self.assertEqual([e.index for e in report.errors], [1, 2])
+        self.assertIn('duplicate address', report.errors[0].issues[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import time
+import threading
+import unittest
+from datetime import datetime
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from fireflyapi.device import Device
+from fireflyapi.util import to_timestamp
+from fireflyapi.workers import FleetWorkers, poll_uplinks, _worker_main
+from tests.fake import FakeTransport, fake_api
+
+_EUI = '00000000000000aa'
+_T0 = 1488362400.0
+
+
+def _stamp(api, device, state):
+    return [time.time()]
+
+
+def _iso(ts):
+    return datetime.utcfromtimestamp(ts).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+class PollUplinksTest(unittest.TestCase):
+
+    def setUp(self):
+        # oldest first, firefly filters received_after with second precision
+        self.packets = []
+
+        def packets(endpoint, query, data):
+            after = to_timestamp(query.get('received_after') or 0)
+            matching = [p for p in self.packets if to_timestamp(p['received_at']) >= after]
+            limit, offset = int(query['limit_to_last']), int(query.get('offset', 0))
+            newest = matching[::-1][offset:offset + limit]
+            return {'count': len(matching), 'packets': newest}
+
+        self.api, self.transport = fake_api({('GET', 'devices/eui/%s/packets' % _EUI): packets})
+        self.device = Device(self.api, eui=_EUI, _exists=True)
+
+    def _add(self, n, start=0.0):
+        for i in range(n):
+            fcnt = len(self.packets)
+            self.packets.append({'fcnt': fcnt, 'received_at': _iso(_T0 + start + i * 0.25), 'payload': 'aa'})
+
+    def test_pages_through_the_whole_range(self):
+        self._add(250)
+        state = {'start': _T0 - 1}
+        ret = poll_uplinks(self.api, self.device, state, chunksize=100)
+        self.assertEqual([r.fcnt for r in ret], list(range(250)))
+
+    def test_no_duplicates_within_the_cursor_second(self):
+        self._add(3)
+        state = {'start': _T0 - 1}
+        self.assertEqual([r.fcnt for r in poll_uplinks(self.api, self.device, state)], [0, 1, 2])
+        self.assertEqual(poll_uplinks(self.api, self.device, state), [])
+
+        self._add(2, start=0.75)
+        self.assertEqual([r.fcnt for r in poll_uplinks(self.api, self.device, state)], [3, 4])
+        self.assertEqual(poll_uplinks(self.api, self.device, state), [])
+
+    def test_first_round_starts_with_the_latest_packet(self):
+        self._add(5)
+        state = {}
+        self.assertEqual([r.fcnt for r in poll_uplinks(self.api, self.device, state)], [4])
+        self.assertEqual(poll_uplinks(self.api, self.device, state), [])
+
+
+class WorkerRuntimeTest(unittest.TestCase):
+
+    def test_new_devices_are_polled_right_away(self):
+        control, output = queue.Queue(), queue.Queue()
+        api_args = {'transport': FakeTransport({('GET', 'devices/eui/*'): {'device': {'eui': _EUI}}}), 'loglevel': 40}
+        worker = threading.Thread(target=_worker_main, args=(0, _stamp, 'test', api_args, control, output, 60))
+        worker.daemon = True
+        worker.start()
+        self.addCleanup(worker.join, 10)
+        self.addCleanup(control.put, ('stop',))
+
+        # the first (empty) round is over, the assignment arrives during the interval
+        time.sleep(0.2)
+        control.put(('assign', [_EUI], None))
+        self.assertEqual(output.get(timeout=5).eui, _EUI)
+
+    def test_rate_shares_add_up_to_the_limit(self):
+        fleet = FleetWorkers(_stamp, ['%016x' % i for i in range(3)], 'test', rate_limit=10)
+        for wid in range(6):
+            fleet._workers[wid] = (None, queue.Queue())
+            fleet._ring.add(wid)
+        fleet._rebalance()
+
+        rates = [control.get_nowait()[2] for _, control in fleet._workers.values()]
+        self.assertAlmostEqual(sum(r for r in rates if r), 10)
+        self.assertIn(None, rates)
+
+
+if __name__ == '__main__':
+    unittest.main()